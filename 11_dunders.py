@@ -308,4 +308,725 @@ class Point:
 # %% codecell
 c = Point(5,6)
 print(c('X'))
-print(c('Y'))
\ No newline at end of file
+print(c('Y'))
+
+# %% [md]
+# # Columnar Points - PointArray
+# * Every Point is a full Python object with its own __dict__
+# * Millions of Points means millions of objects, and + == hash run one object at a time
+# * A companion container can hold all x values in one array and all y values in another
+# * The same dunders (__add__, __eq__, __call__) then work on whole columns at once
+# * __len__ and __getitem__ let the container behave like a list of Points
+
+# %% codecell
+import numpy as np
+
+class PointArray():
+
+    # Constructor - x and y are stored as contiguous columns
+    # np.ascontiguousarray does not copy when handed a contiguous array
+    def __init__(self, x, y):
+        self._x = np.ascontiguousarray(x)
+        self._y = np.ascontiguousarray(y)
+        if self._x.shape != self._y.shape or self._x.ndim != 1:
+            raise ValueError('x and y must be one dimensional and the same length')
+
+    # Alternative constructor from a list of Points
+    @classmethod
+    def fromPoints(cls, points):
+        n = len(points)
+        x = np.fromiter((p._x for p in points), dtype=np.float64, count=n)
+        y = np.fromiter((p._y for p in points), dtype=np.float64, count=n)
+        return cls(x, y)
+
+    # Back to a list of Points
+    def toPoints(self):
+        return [Point(x, y) for x, y in zip(self._x.tolist(), self._y.tolist())]
+
+    # Called by repr(). Object information
+    def __repr__(self):
+        return f'{self.__class__.__name__}, ({len(self)} points)'
+
+    # Called by str(). Readable formatting
+    def __str__(self):
+        return str(list(zip(self._x.tolist(), self._y.tolist())))
+
+    # Called by len()
+    def __len__(self):
+        return len(self._x)
+
+    # Indexing returns a Point, slicing returns a PointArray view (no copy)
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Point(self._x[index].item(), self._y[index].item())
+        return PointArray(self._x[index], self._y[index])
+
+    # Adding - another PointArray (row by row) or a single Point (broadcast)
+    # Anything without x and y columns returns NotImplemented, so Python can try the other operand
+    def __add__(self, obj):
+        try:
+            return PointArray(self._x + obj._x, self._y + obj._y)
+        except AttributeError:
+            return NotImplemented
+
+    # Equals - a boolean array, one entry per row (like numpy)
+    def __eq__(self, obj):
+        try:
+            return (self._x == obj._x) & (self._y == obj._y)
+        except AttributeError:
+            return NotImplemented
+
+    # The container is mutable, so it is unhashable (like a list)
+    # Use hashes() or keys() to hash the rows instead
+    __hash__ = None
+
+    # Row hashes computed in bulk from the raw bits of x and y
+    # Equal rows share a hash; good for bucketing and grouping
+    def hashes(self):
+        # Cast to float64 so every dtype hashes 8 bytes per value; + 0.0 folds -0.0 into 0.0
+        x = np.add(self._x, 0.0, dtype=np.float64).view(np.uint64)
+        y = np.add(self._y, 0.0, dtype=np.float64).view(np.uint64)
+        h = x * np.uint64(0x9E3779B97F4A7C15)
+        h ^= y + np.uint64(0x632BE59BD9B4E019) + (h << np.uint64(6)) + (h >> np.uint64(2))
+        return h.view(np.int64)
+
+    # Row keys as tuples; hash((x, y)) is the same hash Point uses
+    def keys(self):
+        return list(zip(self._x.tolist(), self._y.tolist()))
+
+    # Call - whole column access
+    def __call__(self, val):
+        if val == 'X' or val == 'x':
+            return self._x
+        if val == 'Y' or val == 'y':
+            return self._y
+
+# %% codecell
+pa = PointArray.fromPoints([Point(5, 5), Point(3, 3), Point(10, 10)])
+print(repr(pa))
+print(pa)
+print(pa('x'))
+print(pa + Point(1, 1))
+print(pa == PointArray([5, 0, 10], [5, 0, 10]))
+print(pa[1:])
+print(pa.hashes())
+print(PointArray(np.float32([5, 3]), np.float32([5, 3])).hashes() == pa[:2].hashes(), pa == 'points')
+
+# %% [md]
+# # Benchmark - List of Points vs PointArray
+# * 1M points, add two sets together, compare them and insert them into a dict
+# * The list path calls a dunder per Point; the array path calls each dunder once
+
+# %% codecell
+import time
+import tracemalloc
+
+def timeit(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f'{label:<24} {time.perf_counter() - start:8.3f} s')
+    return result
+
+N = 1_000_000
+rng = np.random.default_rng(0)
+xs = rng.integers(0, 1000, N).astype(np.float64)
+ys = rng.integers(0, 1000, N).astype(np.float64)
+
+tracemalloc.start()
+points1 = timeit('list - build', lambda: [Point(x, y) for x, y in zip(xs.tolist(), ys.tolist())])
+print(f'list - memory            {tracemalloc.get_traced_memory()[0] / 1e6:8.1f} MB')
+tracemalloc.stop()
+points2 = points1[::-1]
+
+tracemalloc.start()
+array1 = timeit('array - build', lambda: PointArray(xs.copy(), ys.copy()))
+print(f'array - memory           {tracemalloc.get_traced_memory()[0] / 1e6:8.1f} MB')
+tracemalloc.stop()
+array2 = array1[::-1]
+
+timeit('list - add', lambda: [p1 + p2 for p1, p2 in zip(points1, points2)])
+timeit('array - add', lambda: array1 + array2)
+timeit('list - compare', lambda: [p1 == p2 for p1, p2 in zip(points1, points2)])
+timeit('array - compare', lambda: array1 == array2)
+timeit('list - dict insert', lambda: {p: i for i, p in enumerate(points1)})
+timeit('array - dict insert', lambda: dict(zip(array1.keys(), range(N))))
+timeit('array - bulk hash', lambda: array1.hashes())
+
+# %% [md]
+# # Spatial Index - PointIndex
+# * The hash example above uses a dict to map a Point to what's there ('Treasure', 'Trap', 'Ship')
+# * Asking "what's within radius r of this Point" means scanning every key in the dict
+# * A spatial hash buckets Points into a grid of square cells
+# * A radius query only visits the cells the circle overlaps
+# * A nearest neighbor query searches rings of cells outward until nothing closer can remain
+# * Points remain the keys, so lookups use their own __eq__ and __hash__
+# * Dict dunders (__setitem__, __getitem__, __delitem__, __contains__, __len__, __iter__) give it a dict feel
+
+# %% codecell
+import heapq
+import math
+
+class PointIndex():
+
+    # Constructor - cellSize should be about the typical query radius
+    def __init__(self, cellSize=1.0):
+        self._cellSize = cellSize
+        self._items = {}   # Point -> value
+        self._cells = {}   # (col, row) -> set of Points
+
+    # Grid cell holding a coordinate
+    def _cell(self, x, y):
+        return (math.floor(x / self._cellSize), math.floor(y / self._cellSize))
+
+    # Called by repr(). Object information
+    def __repr__(self):
+        return f'{self.__class__.__name__}, ({len(self)} points, {len(self._cells)} cells)'
+
+    # Called by len()
+    def __len__(self):
+        return len(self._items)
+
+    # Called by iter() - iterates over the Points like a dict does over keys
+    def __iter__(self):
+        return iter(self._items)
+
+    # Called by in
+    def __contains__(self, point):
+        return point in self._items
+
+    # Exact lookup
+    def __getitem__(self, point):
+        return self._items[point]
+
+    # Insert or replace
+    def __setitem__(self, point, value):
+        if point not in self._items:
+            self._cells.setdefault(self._cell(point._x, point._y), set()).add(point)
+        self._items[point] = value
+
+    # Delete - empty cells are dropped so the grid doesn't grow forever
+    def __delitem__(self, point):
+        del self._items[point]
+        cell = self._cell(point._x, point._y)
+        bucket = self._cells[cell]
+        bucket.discard(point)
+        if not bucket:
+            del self._cells[cell]
+
+    def get(self, point, default=None):
+        return self._items.get(point, default)
+
+    def items(self):
+        return self._items.items()
+
+    # All (point, value) pairs within radius of center
+    def within(self, center, radius):
+        cx, cy = center._x, center._y
+        col0, row0 = self._cell(cx - radius, cy - radius)
+        col1, row1 = self._cell(cx + radius, cy + radius)
+        r2 = radius * radius
+        found = []
+        # Visit whichever is smaller - the overlapped cells or the occupied cells
+        if (col1 - col0 + 1) * (row1 - row0 + 1) <= len(self._cells):
+            cells = ((col, row) for col in range(col0, col1 + 1) for row in range(row0, row1 + 1))
+        else:
+            cells = (cell for cell in self._cells if col0 <= cell[0] <= col1 and row0 <= cell[1] <= row1)
+        for cell in cells:
+            for p in self._cells.get(cell, ()):
+                if (p._x - cx) ** 2 + (p._y - cy) ** 2 <= r2:
+                    found.append((p, self._items[p]))
+        return found
+
+    # Cells on the square ring at Chebyshev distance 'ring' from (col, row) - the perimeter only
+    @staticmethod
+    def _ring(col, row, ring):
+        if ring == 0:
+            yield (col, row)
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield (c, row - ring)
+            yield (c, row + ring)
+        for r in range(row - ring + 1, row + ring):
+            yield (col - ring, r)
+            yield (col + ring, r)
+
+    # The k closest (distance, point, value) triples, nearest first
+    def nearest(self, center, k=1):
+        if k <= 0:
+            return []
+        cx, cy = center._x, center._y
+        col, row = self._cell(cx, cy)
+        best = []      # max heap of (-distance, tiebreak, point)
+        seen = 0
+        ring = 0
+        while seen < len(self._items):
+            # Once the rings cover more cells than are occupied, scan the occupied cells left over instead
+            if (2 * ring + 1) ** 2 > len(self._cells):
+                cells = [cell for cell in self._cells if max(abs(cell[0] - col), abs(cell[1] - row)) >= ring]
+            else:
+                cells = self._ring(col, row, ring)
+            for cell in cells:
+                for p in self._cells.get(cell, ()):
+                    seen += 1
+                    d = math.hypot(p._x - cx, p._y - cy)
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, id(p), p))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, id(p), p))
+            # Anything in the next ring is at least ring * cellSize away
+            if len(best) == k and -best[0][0] <= ring * self._cellSize:
+                break
+            ring += 1
+        return [(-d, p, self._items[p]) for d, _, p in sorted(best, reverse=True)]
+
+# %% codecell
+index = PointIndex(cellSize=5)
+index[Point(5, 5)]   = 'Treasure'
+index[Point(3, 3)]   = 'Trap'
+index[Point(10, 10)] = 'Ship'
+
+print(index[Point(5, 5)])
+print([v for p, v in index.within(Point(4, 4), 2)])
+print([v for d, p, v in index.nearest(Point(9, 9), k=2)])
+del index[Point(3, 3)]
+print(Point(3, 3) in index, len(index))
+
+# %% [md]
+# # Benchmark - Dict Scan vs PointIndex
+# * 100k Points on a 1000 x 1000 map, 100 radius and nearest neighbor queries
+# * The dict has to look at every Point for each query
+
+# %% codecell
+N = 100_000
+rng = np.random.default_rng(0)
+coords = rng.uniform(0, 1000, (N, 2)).tolist()
+queries = [Point(x, y) for x, y in rng.uniform(0, 1000, (100, 2)).tolist()]
+
+d = {Point(x, y): i for i, (x, y) in enumerate(coords)}
+
+def buildIndex():
+    index = PointIndex(cellSize=10)
+    for p, v in d.items():
+        index[p] = v
+    return index
+
+index = timeit('index - build', buildIndex)
+
+def scanWithin(center, radius):
+    return [(p, v) for p, v in d.items() if (p._x - center._x) ** 2 + (p._y - center._y) ** 2 <= radius ** 2]
+
+def scanNearest(center, k):
+    return heapq.nsmallest(k, ((math.hypot(p._x - center._x, p._y - center._y), p, v) for p, v in d.items()),
+                           key=lambda t: t[0])
+
+timeit('dict - radius 10', lambda: [scanWithin(q, 10) for q in queries])
+timeit('index - radius 10', lambda: [index.within(q, 10) for q in queries])
+timeit('dict - nearest 5', lambda: [scanNearest(q, 5) for q in queries])
+timeit('index - nearest 5', lambda: [index.nearest(q, 5) for q in queries])
+
+# Same answers
+assert all(sorted(v for _, v in scanWithin(q, 10)) == sorted(v for _, v in index.within(q, 10)) for q in queries)
+assert all([v for _, _, v in scanNearest(q, 5)] == [v for _, _, v in index.nearest(q, 5)] for q in queries)
+
+# %% [md]
+# # Immutable Points - FrozenPoint
+# * The hash rules above say a hash must never change, yet our Point is mutable
+# * Point also recomputes hash((x, y)) every time a dict asks for it
+# * __slots__ replaces the per-object __dict__ with fixed storage, so each object is smaller
+# * Blocking __setattr__ makes the object immutable, so the hash can be computed once and cached
+# * Here is a use for __new__: with intern=True, repeated coordinates hand back the same object
+# * A WeakValueDictionary holds the interned Points without keeping them alive
+
+# %% codecell
+import weakref
+
+class FrozenPoint():
+    __slots__ = ('_x', '_y', '_hash', '__weakref__')
+    _interned = weakref.WeakValueDictionary()
+
+    # __new__ does all the work, so an interned object isn't re-initialized
+    def __new__(cls, x, y, intern=False):
+        if intern:
+            obj = cls._interned.get((x, y))
+            if obj is not None:
+                return obj
+        obj = super().__new__(cls)
+        object.__setattr__(obj, '_x', x)
+        object.__setattr__(obj, '_y', y)
+        object.__setattr__(obj, '_hash', hash((x, y)))
+        if intern:
+            cls._interned[(x, y)] = obj
+        return obj
+
+    # Immutable - no assignment after construction
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    @property
+    def x(self):
+        return self._x
+
+    @property
+    def y(self):
+        return self._y
+
+    # Called by repr(). Object information
+    def __repr__(self):
+        return f'{self.__class__.__name__}, ({self._x}, {self._y})'
+
+    # Called by str(). Readable formatting
+    def __str__(self):
+        return f'({self._x}, {self._y})'
+
+    # Adding Points
+    def __add__(self, obj):
+        return (self._x + obj._x, self._y + obj._y)
+
+    # Equals - identical objects are equal without comparing fields
+    # Other types return NotImplemented, so Python asks the other operand (e.g. Point)
+    def __eq__(self, obj):
+        if self is obj:
+            return True
+        if not isinstance(obj, FrozenPoint):
+            return NotImplemented
+        return self._hash == obj._hash and self._x == obj._x and self._y == obj._y
+
+    # Hash - computed once in __new__
+    def __hash__(self):
+        return self._hash
+
+    # Called by copy and pickle - rebuild through __new__, since __setattr__ refuses to restore fields
+    def __reduce__(self):
+        return (self.__class__, (self._x, self._y))
+
+    # Call
+    def __call__(self, val):
+        if val == 'X' or val == 'x':
+            return self._x
+        if val == 'Y' or val == 'y':
+            return self._y
+
+# %% codecell
+fp = FrozenPoint(5, 5)
+print(fp, hash(fp) == hash(Point(5, 5)))
+try:
+    fp._x = 10
+except AttributeError as e:
+    print(e)
+
+print(FrozenPoint(3, 3, intern=True) is FrozenPoint(3, 3, intern=True))
+print(FrozenPoint(3, 3) is FrozenPoint(3, 3))
+
+import copy
+import pickle
+print(fp == Point(5, 5), copy.copy(fp) == fp, pickle.loads(pickle.dumps(fp)) == fp)
+
+# %% [md]
+# # Benchmark - Point vs FrozenPoint
+# * Memory per object (and objects per GB) measured with tracemalloc
+# * Dict inserts and lookups per second
+# * Interning with only 100 distinct coordinates shows the shared object savings
+# * Note: since Python 3.11 a plain object's __dict__ is already compact, and the cached hash
+#   is itself an int object, so FrozenPoint trades a few bytes for faster dicts and immutability.
+#   The big memory win comes from interning when coordinates repeat.
+
+# %% codecell
+import sys
+
+N = 500_000
+coords = rng.integers(0, 1000, (N, 2)).tolist()
+repeated = rng.integers(0, 10, (N, 2)).tolist()
+
+def measure(label, make, coords):
+    tracemalloc.start()
+    objs = [make(x, y) for x, y in coords]
+    size = tracemalloc.get_traced_memory()[0] - sys.getsizeof(objs)
+    tracemalloc.stop()
+    print(f'{label:<24} {size / N:8.1f} bytes/object {1e9 * N / size / 1e6:8.1f} M objects/GB')
+    return objs
+
+def throughput(label, objs):
+    start = time.perf_counter()
+    d = {}
+    for p in objs:
+        d[p] = 1
+    insert = time.perf_counter() - start
+    start = time.perf_counter()
+    for p in objs:
+        d[p]
+    lookup = time.perf_counter() - start
+    print(f'{label:<24} {N / insert / 1e6:8.2f} M inserts/s {N / lookup / 1e6:8.2f} M lookups/s')
+
+points = measure('Point', Point, coords)
+frozen = measure('FrozenPoint', FrozenPoint, coords)
+interned = measure('FrozenPoint interned', lambda x, y: FrozenPoint(x, y, intern=True), repeated)
+throughput('Point', points)
+throughput('FrozenPoint', frozen)
+
+# %% [md]
+# # With Block - A Profiling Scope
+# * Our Point's __enter__ returns None, so "with Point(3, 3) as pt" binds pt to None
+# * Whatever __enter__ returns is what "as" binds - usually self
+# * __exit__ runs even when the block raises; returning False lets the exception continue
+# * Here the pair times a region of code: wall time, CPU time and (if tracemalloc is on) memory
+# * Every scope reports to one process-wide registry that totals by name
+# * The registry can dump a table or JSON
+
+# %% codecell
+import json
+import threading
+
+class ScopeRegistry():
+    """
+    Totals the timings recorded by every Scope, keyed by scope name.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, wall, cpu, allocated):
+        with self._lock:
+            stat = self._stats.get(name)
+            if stat is None:
+                stat = self._stats[name] = {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'allocated': 0, 'maxWall': 0.0}
+            stat['calls'] += 1
+            stat['wall'] += wall
+            stat['cpu'] += cpu
+            stat['allocated'] += allocated
+            stat['maxWall'] = max(stat['maxWall'], wall)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(stat) for name, stat in self._stats.items()}
+
+    def json(self):
+        return json.dumps(self.stats(), indent=2)
+
+    def table(self):
+        lines = [f'{"scope":<30} {"calls":>8} {"wall s":>10} {"cpu s":>10} {"max wall s":>11} {"alloc KB":>10}']
+        for name, s in sorted(self.stats().items(), key=lambda kv: -kv[1]['wall']):
+            lines.append(f'{name:<30} {s["calls"]:>8} {s["wall"]:>10.4f} {s["cpu"]:>10.4f} '
+                         f'{s["maxWall"]:>11.4f} {s["allocated"] / 1024:>10.1f}')
+        return '\n'.join(lines)
+
+registry = ScopeRegistry()
+
+class Scope():
+    """
+    A named with block that records its timings in the registry.
+    The same Scope can be entered again, even while it is already open.
+    """
+    def __init__(self, name, registry=registry):
+        self.name = name
+        self.registry = registry
+        self._starts = []
+
+    def __enter__(self):
+        allocated = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        self._starts.append((time.perf_counter(), time.process_time(), allocated))
+        return self
+
+    # exc_type - Exception Type
+    # exc_val  - Exception Value
+    # exc_tb   - Exception Traceback
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        wall, cpu, allocated = self._starts.pop()
+        if tracemalloc.is_tracing():
+            allocated = tracemalloc.get_traced_memory()[0] - allocated
+        else:
+            allocated = 0
+        self.registry.record(self.name, time.perf_counter() - wall, time.process_time() - cpu, allocated)
+        return False
+
+# %% [md]
+# Our Point can use the same dunders: __enter__ hands back the Point and
+# the time spent inside the block is recorded under the Point's name.
+
+# %% codecell
+class Point:
+
+    # Constructor
+    def __init__(self, x, y):
+        self._x = x
+        self._y = y
+        self._scope = None
+
+    # Called by repr(). Object information
+    def __repr__(self):
+        return f'{self.__class__.__name__}, ({self._x}, {self._y})'
+
+    # Called by str(). Readable formatting
+    def __str__(self):
+        return f'({self._x}, {self._y})'
+
+    # Adding Points
+    def __add__(self, obj):
+        return (self._x + obj._x, self._y + obj._y)
+
+    # Equals
+    def __eq__(self, obj):
+        if (self._x == obj._x and self._y == obj._y):
+            return True
+        return False
+
+    # Hash
+    def __hash__(self):
+        return hash((self._x, self._y))
+
+    # With Support - the Point is what "as" binds
+    # The Scope is only created the first time the Point is used in a with block
+    def __enter__(self):
+        if self._scope is None:
+            self._scope = Scope(f'Point({self._x}, {self._y})')
+        self._scope.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self._scope.__exit__(exc_type, exc_val, exc_tb)
+
+    # Call
+    def __call__(self, val):
+        if val == 'X' or val == 'x':
+            return self._x
+        if val == 'Y' or val == 'y':
+            return self._y
+
+# %% codecell
+registry.reset()
+tracemalloc.start()
+
+with Point(3, 3) as pt:
+    print('Using our Point', pt)
+    neighbors = [Point(pt('x') + i, pt('y')) for i in range(10_000)]
+
+for _ in range(5):
+    with Scope('sum squares'):
+        sum(i * i for i in range(100_000))
+
+with Scope('allocate'):
+    block = [0] * 1_000_000
+
+tracemalloc.stop()
+print(registry.table())
+print(registry.json())
+
+# %% [md]
+# # Call - Faster Field Access
+# * Our __call__ compares strings (val == 'X' or val == 'x') on every access
+# * A dict maps each spelling straight to a getter
+# * accessor() resolves the field once and returns that getter for tight loops
+# * __call__ stays as it is - the cost is the method call itself, not just the comparisons
+# * extract() pulls fields from a whole sequence of Points into numpy arrays
+# * np.fromiter with one getter per field beats building (x, y) tuples in a single pass
+
+# %% codecell
+from operator import attrgetter
+
+class Point:
+    _FIELDS = {'X': attrgetter('_x'), 'x': attrgetter('_x'), 'Y': attrgetter('_y'), 'y': attrgetter('_y')}
+
+    # Constructor
+    def __init__(self, x, y):
+        self._x = x
+        self._y = y
+        self._scope = None
+
+    # Called by repr(). Object information
+    def __repr__(self):
+        return f'{self.__class__.__name__}, ({self._x}, {self._y})'
+
+    # Called by str(). Readable formatting
+    def __str__(self):
+        return f'({self._x}, {self._y})'
+
+    # Adding Points
+    def __add__(self, obj):
+        return (self._x + obj._x, self._y + obj._y)
+
+    # Equals
+    def __eq__(self, obj):
+        if (self._x == obj._x and self._y == obj._y):
+            return True
+        return False
+
+    # Hash
+    def __hash__(self):
+        return hash((self._x, self._y))
+
+    # With Support - the Point is what "as" binds
+    def __enter__(self):
+        if self._scope is None:
+            self._scope = Scope(f'Point({self._x}, {self._y})')
+        self._scope.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self._scope.__exit__(exc_type, exc_val, exc_tb)
+
+    # Call
+    def __call__(self, val):
+        if val == 'X' or val == 'x':
+            return self._x
+        if val == 'Y' or val == 'y':
+            return self._y
+
+    # A getter for one field, resolved once and reused for every Point
+    @classmethod
+    def accessor(cls, val):
+        return cls._FIELDS[val]
+
+    # Fields from many Points, one numpy array per field
+    # fields is a string ('x', 'xy', 'YX') or a sequence of field names
+    @classmethod
+    def extract(cls, points, fields='xy', dtype=np.float64):
+        getters = [cls._FIELDS[f] for f in fields]
+        return tuple(np.fromiter(map(getter, points), dtype=dtype, count=len(points)) for getter in getters)
+
+# %% codecell
+c = Point(5, 6)
+print(c('X'), c('y'))
+
+getX = Point.accessor('x')
+print(getX(c))
+
+xs, ys = Point.extract([Point(1, 2), Point(3, 4), Point(5, 6)], 'xy')
+print(xs, ys)
+
+# %% [md]
+# # Benchmark - 10M Field Accesses
+# * 1M Points, x and y read 5 times each
+# * __call__ vs a resolved accessor vs extract()
+
+# %% codecell
+N = 1_000_000
+REPEAT = 5
+coords = rng.integers(0, 1000, (N, 2)).tolist()
+points = [Point(x, y) for x, y in coords]
+
+def perCall(points):
+    for _ in range(REPEAT):
+        for p in points:
+            p('x')
+            p('y')
+
+def withAccessor(points):
+    getX, getY = Point.accessor('x'), Point.accessor('y')
+    for _ in range(REPEAT):
+        for p in points:
+            getX(p)
+            getY(p)
+
+def withExtract(points):
+    for _ in range(REPEAT):
+        Point.extract(points, 'xy')
+
+timeit('__call__', lambda: perCall(points))
+timeit('accessor', lambda: withAccessor(points))
+timeit('extract', lambda: withExtract(points))
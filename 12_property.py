@@ -91,4 +91,150 @@ p.fullName = 'Tom T'
 
 # %% codecell
 # Can't get the state directly
-print(p.__firstName)
\ No newline at end of file
+print(p.__firstName)
+
+# %% [md]
+# # Cached Properties
+# * fullName rebuilds the string on every read
+# * Real derived properties are often costly (formatting, lookups) and read far more than written
+# * functools.cached_property computes once and stores the value in the instance __dict__
+# * Later reads find the value in __dict__ and never call the method again
+# * The catch: the cached value goes stale when firstName or lastName change
+# * cachedProperty lists the properties it depends on
+# * Those properties' setters then clear only the cached values that depend on them
+# * Like cached_property, assigning p.fullName = ... no longer raises, it overwrites the cached value
+
+# %% codecell
+from functools import cached_property
+
+class InvalidatingProperty(property):
+    """
+    A property whose setter clears the cached properties that depend on it.
+    """
+    def __init__(self, fget=None, fset=None, fdel=None, doc=None):
+        super().__init__(fget, fset, fdel, doc)
+        self.dependents = set()
+
+    def __set__(self, obj, value):
+        super().__set__(obj, value)
+        cache = obj.__dict__
+        for name in self.dependents:
+            cache.pop(name, None)
+
+class DependentProperty(cached_property):
+    """
+    A cached_property that is cleared whenever a property it depends on is set.
+    The dependencies must be properties of the same class.
+    """
+    def __init__(self, func, depends):
+        super().__init__(func)
+        self.depends = depends
+
+    # Called once the class is built - swap each dependency for an InvalidatingProperty
+    def __set_name__(self, owner, name):
+        super().__set_name__(owner, name)
+        for dep in self.depends:
+            prop = getattr(owner, dep)
+            if not isinstance(prop, InvalidatingProperty):
+                prop = InvalidatingProperty(prop.fget, prop.fset, prop.fdel, prop.__doc__)
+                setattr(owner, dep, prop)
+            prop.dependents.add(name)
+
+def cachedProperty(*depends):
+    def decorator(func):
+        return DependentProperty(func, depends)
+    return decorator
+
+# %% codecell
+class Person():
+    def __init__(self):
+        self.__firstName = None
+        self.__lastName  = None
+
+    @property
+    def firstName(self):
+        return self.__firstName
+
+    @firstName.setter
+    def firstName(self, value):
+        self.__firstName = value
+
+    @property
+    def lastName(self):
+        return self.__lastName
+
+    @lastName.setter
+    def lastName(self, value):
+        self.__lastName = value
+
+    @cachedProperty('firstName', 'lastName')
+    def fullName(self):
+        print('  computing fullName')
+        return self.__firstName + " " + self.__lastName
+
+    @cachedProperty('firstName')
+    def greeting(self):
+        print('  computing greeting')
+        return 'Hello ' + self.__firstName
+
+# %% codecell
+p = Person()
+p.firstName = 'Tom'
+p.lastName = 'Thumb'
+
+print(p.fullName)
+print(p.fullName)   # cached
+print(p.greeting)
+
+p.lastName = 'Jones'
+print(p.fullName)   # recomputed
+print(p.greeting)   # still cached - greeting doesn't depend on lastName
+
+# %% [md]
+# # Benchmark - Read Heavy Workload
+# * 1M reads of a derived property, with a write every 1000 reads
+# * Derived values stand in for costly work with a formatting step
+
+# %% codecell
+import time
+
+class PlainPerson():
+    def __init__(self, firstName, lastName):
+        self.__firstName = firstName
+        self.__lastName  = lastName
+
+    @property
+    def firstName(self):
+        return self.__firstName
+
+    @firstName.setter
+    def firstName(self, value):
+        self.__firstName = value
+
+    @property
+    def lastName(self):
+        return self.__lastName
+
+    @lastName.setter
+    def lastName(self, value):
+        self.__lastName = value
+
+    @property
+    def fullName(self):
+        return f'{self.__lastName.upper()}, {self.__firstName.title()}'
+
+class CachedPerson(PlainPerson):
+    @cachedProperty('firstName', 'lastName')
+    def fullName(self):
+        return f'{self.lastName.upper()}, {self.firstName.title()}'
+
+def readHeavy(person, reads=1_000_000, writeEvery=1000):
+    start = time.perf_counter()
+    for i in range(reads):
+        if i % writeEvery == 0:
+            person.lastName = f'Thumb{i}'
+        person.fullName
+    return reads / (time.perf_counter() - start)
+
+print(f'property       {readHeavy(PlainPerson("tom", "thumb")) / 1e6:6.2f} M reads/s')
+print(f'cachedProperty {readHeavy(CachedPerson("tom", "thumb")) / 1e6:6.2f} M reads/s')
@@ -72,3 +72,121 @@ class PrivateVariables():
 # %% codecell
 p = PrivateVariables('First', 'Last')
 print(p.__firstName)
+
+# %% [md]
+# # Slots for Private & Protected Member Variables
+# * Each object normally keeps its variables in a per-instance __dict__
+# * __slots__ swaps that dict for fixed storage - smaller objects, faster access
+# * Private names are mangled: self.__firstName is stored as _PrivateVariables__firstName
+# * Writing __slots__ by hand means listing every variable, mangled or not
+# * The Slotted mixin takes the names as class keywords and writes __slots__ for us
+#   * slots=(...) are used as written
+#   * private=(...) are mangled to _<Class>__name, the same way the compiler mangles self.__name
+# * Mangling still applies - p.__firstName still fails outside the class
+
+# %% codecell
+class SlottedMeta(type):
+    """
+    Metaclass that builds __slots__ from the slots & private names declared on the class.
+    """
+    def __new__(mcls, name, bases, namespace, slots=(), private=()):
+        if '__slots__' not in namespace:
+            mangled = tuple(f"_{name.lstrip('_')}__{field}" for field in private)
+            namespace['__slots__'] = tuple(slots) + mangled
+        return super().__new__(mcls, name, bases, namespace)
+
+    def __init__(cls, name, bases, namespace, slots=(), private=()):
+        super().__init__(name, bases, namespace)
+
+class Slotted(metaclass=SlottedMeta):
+    __slots__ = ()
+
+# %% codecell
+class ProtectedVariables(Slotted, slots=('_firstName', '_lastName')):
+    def __init__(self, firstName, lastName):
+        self._firstName = firstName
+        self._lastName  = lastName
+
+class PrivateVariables(Slotted, private=('firstName', 'lastName')):
+    def __init__(self, firstName, lastName):
+        self.__firstName = firstName
+        self.__lastName  = lastName
+
+class Person(Slotted, private=('firstName', 'lastName')):
+    def __init__(self, firstName, lastName):
+        self.__firstName = firstName
+        self.__lastName  = lastName
+
+    @property
+    def firstName(self):
+        return self.__firstName
+
+    @firstName.setter
+    def firstName(self, value):
+        self.__firstName = value
+
+    @property
+    def lastName(self):
+        return self.__lastName
+
+    @lastName.setter
+    def lastName(self, value):
+        self.__lastName = value
+
+# %% codecell
+print(ProtectedVariables.__slots__)
+print(PrivateVariables.__slots__)
+print(Person.__slots__)
+
+p = Person('First', 'Last')
+p.firstName = 'Tom'
+print(p.firstName, hasattr(p, '__dict__'))
+
+# %% codecell
+# Still private - and no __dict__ to add new variables to
+p = PrivateVariables('First', 'Last')
+print(p.__firstName)
+
+# %% [md]
+# # Benchmark - 1M Instances
+# * Memory per object (tracemalloc) and property read speed, dict based vs Slotted
+
+# %% codecell
+import time
+import tracemalloc
+
+class DictPerson():
+    def __init__(self, firstName, lastName):
+        self.__firstName = firstName
+        self.__lastName  = lastName
+
+    @property
+    def firstName(self):
+        return self.__firstName
+
+    @property
+    def lastName(self):
+        return self.__lastName
+
+N = 1_000_000
+names = [(f'First{i}', f'Last{i}') for i in range(N)]
+
+def memory(cls):
+    tracemalloc.start()
+    objs = [cls(first, last) for first, last in names]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objs, size
+
+def reads(objs, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for o in objs:
+            o.firstName
+            o.lastName
+    return 2 * repeat * len(objs) / (time.perf_counter() - start)
+
+for cls in (DictPerson, Person):
+    objs, size = memory(cls)
+    print(f'{cls.__name__:<12} {size / 1e6:8.1f} MB {size / N:6.1f} bytes/object {reads(objs) / 1e6:6.1f} M reads/s')
+    del objs
@@ -31,6 +31,7 @@ class Base():
     """
     A Base class models functionality that can learn from data.
     We use a fit method to handle learning.
+    Learners that can learn a chunk of data at a time also implement partial_fit.
     """
     def __init__(self):
         pass
@@ -38,6 +39,9 @@ class Base():
     def fit(self, X, y):
         pass
 
+    def partial_fit(self, X, y):
+        raise NotImplementedError(f'{self.__class__.__name__} does not support partial_fit')
+
 # %% [md]
 # # Transformations
 # * Transformations transform data
@@ -171,3 +175,2189 @@ pipe.add(LinearModel())
 pipe.fit(X, y)
 pipe.predict(X)
 pipe.transform(X)
+
+# %% [md]
+# # Fitting Steps in Parallel
+# * Pipeline.fit fits each step one after another
+# * Every step is fitted on the same X, y and doesn't use another step's results
+# * So the steps can be fitted at the same time
+# * Threads share memory, and work well for steps that spend their time in NumPy (NumPy releases the GIL)
+# * Pure Python steps hold the GIL, so they need their own process
+# * A process fits a copy of the step, so the fitted copy is sent back and replaces the original
+# * A step says which kind it is with a class attribute, releasesGil
+# * The processes are started before any thread - forking a process while its threads run can deadlock the child
+# * n_jobs is shared between the two pools, so no more than n_jobs steps are fitted at once
+# * Results are collected in step order, and a failure names the step that failed
+
+# %% codecell
+import os
+import time
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+class StepError(Exception):
+    """
+    Raised when a step of a Pipeline fails.  The original exception is the __cause__.
+    """
+    def __init__(self, index, step, action):
+        self.index = index
+        self.step = step
+        super().__init__(f'Step {index} ({step.__class__.__name__}) failed to {action}')
+
+def fitStep(step, X, y):
+    """
+    Fit a step and hand it back - used to return fitted steps from worker processes.
+    """
+    step.fit(X, y)
+    return step
+
+class Pipeline(Base):
+    def __init__(self, n_jobs=1):
+        """
+        n_jobs is the number of steps fitted at once, -1 uses every core.
+        """
+        self.steps = []
+        self.n_jobs = n_jobs
+
+    def add(self, step):
+        self.steps.append(step)
+
+    def fit(self, X, y):
+        steps = [(i, obj) for i, obj in enumerate(self.steps) if isinstance(obj, Base)]
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        if n_jobs == 1 or len(steps) < 2:
+            for i, obj in steps:
+                try:
+                    obj.fit(X, y)
+                except Exception as exc:
+                    raise StepError(i, obj, 'fit') from exc
+            return
+
+        threaded = [(i, obj) for i, obj in steps if getattr(obj, 'releasesGil', False)]
+        forked   = [(i, obj) for i, obj in steps if not getattr(obj, 'releasesGil', False)]
+        # Both pools together run at most n_jobs workers
+        processes = min(len(forked), n_jobs - 1 if threaded else n_jobs)
+        futures = []
+        with ExitStack() as stack:
+            if forked:
+                # Fork before any thread starts - forking while threads run can deadlock the child
+                pool = stack.enter_context(ProcessPoolExecutor(processes))
+                futures += [(i, obj, pool.submit(fitStep, obj, X, y)) for i, obj in forked]
+            if threaded:
+                pool = stack.enter_context(ThreadPoolExecutor(n_jobs - processes))
+                futures += [(i, obj, pool.submit(obj.fit, X, y)) for i, obj in threaded]
+            self._collect(futures)
+
+    def _collect(self, futures):
+        """
+        Wait for every fit in step order; steps fitted in another process are replaced by their fitted copy.
+        """
+        for i, obj, future in sorted(futures, key=lambda f: f[0]):
+            try:
+                fitted = future.result()
+            except Exception as exc:
+                raise StepError(i, obj, 'fit') from exc
+            if fitted is not None:
+                self.steps[i] = fitted
+
+    def transform(self, X):
+        for obj in self.steps:
+            if isinstance(obj, BaseTransform):
+                obj.transform(X)
+
+    def predict(self, X):
+        for obj in self.steps:
+            if isinstance(obj, BaseModel):
+                obj.predict(X)
+
+# %% [md]
+# Two stand-in models with real work to do:
+# * SolverModel spends its time in NumPy's linear algebra, so threads suit it
+# * LoopModel is pure Python, so it goes to a process
+
+# %% codecell
+class SolverModel(BaseModel):
+    releasesGil = True
+
+    def __init__(self, rounds=20):
+        super().__init__()
+        self.rounds = rounds
+
+    def fit(self, X, y):
+        for _ in range(self.rounds):
+            self.coef_ = np.linalg.lstsq(X, y, rcond=None)[0]
+
+    def predict(self, X):
+        return X @ self.coef_
+
+class LoopModel(BaseModel):
+    def __init__(self, rounds=3):
+        super().__init__()
+        self.rounds = rounds
+
+    def fit(self, X, y):
+        total = 0.0
+        for _ in range(self.rounds):
+            for value in y.tolist():
+                total += value
+        self.mean_ = total / (self.rounds * len(y))
+
+    def predict(self, X):
+        return np.full(len(X), self.mean_)
+
+class BrokenModel(BaseModel):
+    def fit(self, X, y):
+        raise ValueError('bad input')
+
+# %% codecell
+rng = np.random.default_rng(0)
+X = rng.normal(size=(100_000, 20))
+y = X @ rng.normal(size=20) + rng.normal(size=100_000)
+
+def build(n_jobs):
+    pipe = Pipeline(n_jobs=n_jobs)
+    for _ in range(4):
+        pipe.add(SolverModel())
+    for _ in range(2):
+        pipe.add(LoopModel())
+    return pipe
+
+for n_jobs in (1, 2, 4):
+    pipe = build(n_jobs)
+    start = time.perf_counter()
+    pipe.fit(X, y)
+    print(f'n_jobs={n_jobs}  {time.perf_counter() - start:6.2f} s  cores={os.cpu_count()}')
+print(pipe.steps[-1].mean_)
+
+# %% codecell
+# The failing step is named in the error
+pipe = Pipeline(n_jobs=2)
+pipe.add(SolverModel(rounds=1))
+pipe.add(BrokenModel())
+try:
+    pipe.fit(X, y)
+except StepError as e:
+    print(e, '<-', repr(e.__cause__))
+
+# %% [md]
+# # Data Flows Through the Pipeline
+# * Our transform and predict hand every step the original X and throw the results away
+# * In a real pipeline each transform's output is the next step's input
+# * fit: a transform is fitted, then transforms X for the steps after it
+# * Models that sit side by side see the same X, so they can still be fitted in parallel
+# * transform: returns X after every transform has been applied
+# * predict: sends X through the transforms and returns the last model's prediction
+# * transform_stream: a generator that pushes batches through the transforms one at a time
+#   * Only one batch is in memory at a time, so data larger than RAM can flow through
+
+# %% codecell
+class Pipeline(Base):
+    def __init__(self, n_jobs=1):
+        """
+        n_jobs is the number of side by side models fitted at once, -1 uses every core.
+        """
+        self.steps = []
+        self.n_jobs = n_jobs
+
+    def add(self, step):
+        self.steps.append(step)
+
+    def fit(self, X, y):
+        models = []
+        for i, obj in enumerate(self.steps):
+            if isinstance(obj, BaseTransform):
+                self._fitModels(models, X, y)
+                models = []
+                self._fitModels([(i, obj)], X, y)
+                X = self._apply(i, self.steps[i], 'transform', X)
+            elif isinstance(obj, Base):
+                models.append((i, obj))
+        self._fitModels(models, X, y)
+
+    def _apply(self, i, obj, action, X):
+        try:
+            return getattr(obj, action)(X)
+        except Exception as exc:
+            raise StepError(i, obj, action) from exc
+
+    def _fitModels(self, steps, X, y):
+        """
+        Fit steps that share the same input, in parallel when n_jobs allows.
+        """
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        if n_jobs == 1 or len(steps) < 2:
+            for i, obj in steps:
+                try:
+                    obj.fit(X, y)
+                except Exception as exc:
+                    raise StepError(i, obj, 'fit') from exc
+            return
+
+        threaded = [(i, obj) for i, obj in steps if getattr(obj, 'releasesGil', False)]
+        forked   = [(i, obj) for i, obj in steps if not getattr(obj, 'releasesGil', False)]
+        # Both pools together run at most n_jobs workers
+        processes = min(len(forked), n_jobs - 1 if threaded else n_jobs)
+        futures = []
+        with ExitStack() as stack:
+            if forked:
+                # Fork before any thread starts - forking while threads run can deadlock the child
+                pool = stack.enter_context(ProcessPoolExecutor(processes))
+                futures += [(i, obj, pool.submit(fitStep, obj, X, y)) for i, obj in forked]
+            if threaded:
+                pool = stack.enter_context(ThreadPoolExecutor(n_jobs - processes))
+                futures += [(i, obj, pool.submit(obj.fit, X, y)) for i, obj in threaded]
+            self._collect(futures)
+
+    def _collect(self, futures):
+        """
+        Wait for every fit in step order; steps fitted in another process are replaced by their fitted copy.
+        """
+        for i, obj, future in sorted(futures, key=lambda f: f[0]):
+            try:
+                fitted = future.result()
+            except Exception as exc:
+                raise StepError(i, obj, 'fit') from exc
+            if fitted is not None:
+                self.steps[i] = fitted
+
+    def transform(self, X):
+        for i, obj in enumerate(self.steps):
+            if isinstance(obj, BaseTransform):
+                X = self._apply(i, obj, 'transform', X)
+        return X
+
+    def _predictor(self):
+        """
+        Index of the step that makes predictions: the last model that isn't also a transform.
+        """
+        models = [i for i, obj in enumerate(self.steps) if isinstance(obj, BaseModel)]
+        plain = [i for i in models if not isinstance(self.steps[i], BaseTransform)]
+        if not models:
+            raise ValueError('Pipeline has no model to predict with')
+        return (plain or models)[-1]
+
+    def predict(self, X):
+        last = self._predictor()
+        for i, obj in enumerate(self.steps[:last]):
+            if isinstance(obj, BaseTransform):
+                X = self._apply(i, obj, 'transform', X)
+        return self._apply(last, self.steps[last], 'predict', X)
+
+    def transform_stream(self, batches):
+        """
+        Lazily transform an iterable of batches, yielding one transformed batch at a time.
+        """
+        for X in batches:
+            yield self.transform(X)
+
+# %% [md]
+# A small transform that returns its result, so there is something to flow
+
+# %% codecell
+class Center(BaseTransform):
+    releasesGil = True
+
+    def __init__(self):
+        pass
+
+    def fit(self, X, y):
+        self.mean_ = X.mean(axis=0)
+
+    def transform(self, X):
+        return X - self.mean_
+
+# %% codecell
+pipe = Pipeline()
+pipe.add(Center())
+pipe.add(SolverModel(rounds=1))
+pipe.fit(X, y)
+print(pipe.transform(X[:3]).round(2)[:, :4])
+print(pipe.predict(X[:3]).round(2), y[:3].round(2))
+
+# %% [md]
+# # Benchmark - Streaming Memory
+# * transform on a whole array needs the input and the output in memory at once
+# * transform_stream over a generator of 10k row batches only ever holds one batch
+# * Peak memory is measured with tracemalloc, which also sees NumPy's allocations
+
+# %% codecell
+import tracemalloc
+
+def batches(rows, batchSize=10_000, features=20, seed=0):
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, batchSize):
+        yield rng.normal(size=(min(batchSize, rows - start), features))
+
+def peak(func):
+    tracemalloc.start()
+    func()
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size / 1e6
+
+def wholeArray(rows):
+    X = np.concatenate(list(batches(rows)))
+    return pipe.transform(X).sum(axis=0)
+
+def streamed(rows):
+    total = 0
+    for out in pipe.transform_stream(batches(rows)):
+        total = total + out.sum(axis=0)
+    return total
+
+for rows in (100_000, 500_000, 1_000_000, 2_000_000):
+    print(f'{rows:>10,} rows   whole array {peak(lambda: wholeArray(rows)):8.1f} MB   '
+          f'stream {peak(lambda: streamed(rows)):6.1f} MB')
+
+# %% [md]
+# # Caching Fitted Steps
+# * Change only the last model, refit, and every step before it is fitted again from scratch
+# * A fitted step depends only on its class, its parameters and its input data
+#   * The class counts by its code too - redefine Normalize with a new fit and old entries no longer match
+# * Hash those three and we have an address for the fitted step - a content addressed cache
+# * Fitted steps are pickled into a directory under that address
+# * Parameters are the public attributes set in __init__; fitted state ends in an underscore (mean_, coef_)
+# * The input is hashed once at the start of the pipeline
+#   * A transform's output is fully decided by the transform's address, so the next step's input
+#     address is simply the transform's address - no need to hash intermediate arrays
+# * When the directory grows past maxBytes, the least recently used entries are deleted
+# * The cache counts hits and misses, and the fit time each hit saved
+# * CachedPipeline opts in by extending Pipeline.fit
+
+# %% codecell
+import hashlib
+import pickle
+import tempfile
+
+def stepParams(step):
+    """
+    A step's parameters: the public attributes set in __init__ (fitted state ends in an underscore).
+    """
+    return {k: v for k, v in vars(step).items() if not k.startswith('_') and not k.endswith('_')}
+
+class FitCache():
+    """
+    On disk store of fitted steps, keyed by step class, parameters and input.
+    """
+    def __init__(self, directory, maxBytes=1_000_000_000):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.secondsSaved = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(*arrays):
+        """
+        Fast content hash of arrays, including their shape and dtype.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        for a in arrays:
+            a = np.ascontiguousarray(a)
+            h.update(f'{a.shape}{a.dtype}'.encode())
+            h.update(memoryview(a).cast('B'))
+        return h.hexdigest()
+
+    _codeKeys = {}
+
+    @classmethod
+    def code(cls, stepClass):
+        """
+        Hash of the bytecode and the names it uses for every method along stepClass's MRO,
+        so a redefined class gets new keys.
+        """
+        if stepClass not in cls._codeKeys:
+            h = hashlib.blake2b(digest_size=16)
+            for klass in stepClass.__mro__:
+                for name, member in sorted(vars(klass).items()):
+                    code = getattr(getattr(member, '__func__', member), '__code__', None)
+                    if code is not None:
+                        h.update(name.encode())
+                        cls._hashCode(h, code)
+            cls._codeKeys[stepClass] = h.hexdigest()
+        return cls._codeKeys[stepClass]
+
+    @classmethod
+    def _hashCode(cls, h, code):
+        h.update(code.co_code)
+        # Names the bytecode refers to by index - X.mean vs X.std differ only here
+        for names in (code.co_names, code.co_varnames, code.co_freevars):
+            h.update(repr(names).encode())
+        for const in code.co_consts:
+            if hasattr(const, 'co_code'):
+                cls._hashCode(h, const)   # nested functions, comprehensions
+            else:
+                h.update(repr(const).encode())
+
+    def key(self, step, inputKey):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f'{type(step).__module__}.{type(step).__qualname__}'.encode())
+        h.update(self.code(type(step)).encode())
+        h.update(pickle.dumps(sorted(stepParams(step).items())))
+        h.update(inputKey.encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key):
+        path = self._path(key)
+        start = time.perf_counter()
+        try:
+            with open(path, 'rb') as f:
+                step, fitSeconds = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(path)   # mark as recently used
+        self.hits += 1
+        self.secondsSaved += fitSeconds - (time.perf_counter() - start)
+        return step
+
+    def put(self, key, step, fitSeconds):
+        path = self._path(key)
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as f:
+            pickle.dump((step, fitSeconds), f)
+        os.replace(f.name, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def report(self):
+        return f'hits={self.hits} misses={self.misses} saved={self.secondsSaved:.2f} s'
+
+class CachedPipeline(Pipeline):
+    """
+    A Pipeline that reuses fitted steps from a FitCache.
+    """
+    def __init__(self, cache, n_jobs=1):
+        super().__init__(n_jobs=n_jobs)
+        self.cache = cache
+
+    def fit(self, X, y):
+        inputKey = self.cache.fingerprint(X, y)
+        models = []
+        for i, obj in enumerate(self.steps):
+            if isinstance(obj, BaseTransform):
+                self._fitCached(models, X, y)
+                models = []
+                inputKey = self._fitCached([(i, obj, self.cache.key(obj, inputKey))], X, y)
+                X = self._apply(i, self.steps[i], 'transform', X)
+            elif isinstance(obj, Base):
+                models.append((i, obj, self.cache.key(obj, inputKey)))
+        self._fitCached(models, X, y)
+
+    def _fitCached(self, steps, X, y):
+        """
+        Load the steps found in the cache, fit the rest and store them.
+        Returns the key of the last step.
+        """
+        missing = []
+        for i, obj, key in steps:
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.append((i, obj, key))
+            else:
+                self.steps[i] = cached
+        if missing:
+            start = time.perf_counter()
+            self._fitModels([(i, obj) for i, obj, _ in missing], X, y)
+            # Steps fitted side by side share the group's time
+            seconds = (time.perf_counter() - start) / len(missing)
+            for i, _, key in missing:
+                self.cache.put(key, self.steps[i], seconds)
+        return steps[-1][2] if steps else None
+
+# %% [md]
+# A transform with a real fit cost: project onto the top singular vectors
+
+# %% codecell
+class SVDProject(BaseTransform):
+    releasesGil = True
+
+    def __init__(self, components=5):
+        self.components = components
+
+    def fit(self, X, y):
+        self.vectors_ = np.linalg.svd(X, full_matrices=False)[2][:self.components].T
+
+    def transform(self, X):
+        return X @ self.vectors_
+
+# %% codecell
+cache = FitCache(tempfile.mkdtemp(), maxBytes=50_000_000)
+
+# Try several models - only the model changes between runs
+for rounds in (5, 10, 15):
+    for attempt in ('first', 'again'):
+        pipe = CachedPipeline(cache)
+        pipe.add(Center())
+        pipe.add(SVDProject(components=10))
+        pipe.add(SolverModel(rounds=rounds))
+        start = time.perf_counter()
+        pipe.fit(X, y)
+        print(f'rounds={rounds:<3} {attempt:<6} {time.perf_counter() - start:6.3f} s   {cache.report()}')
+
+# %% [md]
+# # Real Estimators
+# Until now Normalize, PCA, LinearModel and LogisticModel only print.
+# Here they do the work, behind the same fit / transform / predict methods.
+# * No Python loops over rows - all the work is NumPy operations on blocks of rows
+# * Rows are processed in chunks, so temporary arrays stay small however big X is
+# * Sums are kept in float64 for accuracy, but X itself can be float32 to halve its memory
+# * Normalize - streaming mean and variance, merging each chunk's statistics into the total
+# * PCA - randomized SVD: find the top directions without decomposing all of X
+#   * X is centered on the fly (X @ M - mean @ M), so no centered copy of X is made
+#   * Tall blocks are orthonormalized with Cholesky QR - a small Cholesky and a triangular solve instead of a full QR
+#   * As a model, PCA predicts each row's reconstruction error (large = unusual row)
+# * LinearModel - normal equations: X'X and X'y are summed chunk by chunk, then solved
+# * LogisticModel - IRLS (Newton's method): each step solves a weighted least squares problem; alpha penalizes the coefficients, not the intercept
+
+# %% codecell
+def chunks(n, size):
+    """
+    Slices covering range(n) in blocks of size rows.
+    """
+    for start in range(0, n, size):
+        yield slice(start, min(start + size, n))
+
+def orthonormalize(A):
+    """
+    Orthonormal basis for the columns of a tall matrix (Cholesky QR, done twice for accuracy).
+    """
+    for _ in range(2):
+        gram = (A.T @ A).astype(np.float64)
+        gram += 1e-12 * np.trace(gram) * np.eye(len(gram))
+        L = np.linalg.cholesky(gram).astype(A.dtype)
+        # A = Q L', solved for Q by forward substitution one column at a time - no explicit inverse
+        Q = np.array(A, order='F')
+        for j in range(len(L)):
+            Q[:, j] -= Q[:, :j] @ L[j, :j]
+            Q[:, j] /= L[j, j]
+        A = Q
+    return A
+
+class Normalize(BaseTransform):
+    releasesGil = True
+
+    def __init__(self, chunkSize=100_000):
+        self.chunkSize = chunkSize
+
+    def fit(self, X, y=None):
+        count, mean, m2 = 0, np.zeros(X.shape[1]), np.zeros(X.shape[1])
+        for rows in chunks(len(X), self.chunkSize):
+            block = X[rows].astype(np.float64)
+            n = len(block)
+            blockMean = block.mean(axis=0)
+            blockM2 = ((block - blockMean) ** 2).sum(axis=0)
+            # Merge the chunk's statistics into the running totals (Chan et al.)
+            delta = blockMean - mean
+            total = count + n
+            mean = mean + delta * n / total
+            m2 = m2 + blockM2 + delta ** 2 * count * n / total
+            count = total
+        self.mean_ = mean
+        self.scale_ = np.sqrt(m2 / count)
+        self.scale_[self.scale_ == 0] = 1.0
+
+    def transform(self, X):
+        return (X - self.mean_.astype(X.dtype, copy=False)) / self.scale_.astype(X.dtype, copy=False)
+
+class PCA(BaseModel, BaseTransform):
+    releasesGil = True
+
+    def __init__(self, components=2, oversample=10, powerIterations=4, seed=0):
+        self.components = components
+        self.oversample = oversample
+        self.powerIterations = powerIterations
+        self.seed = seed
+
+    def fit(self, X, y=None):
+        rng = np.random.default_rng(self.seed)
+        mean = X.mean(axis=0, dtype=np.float64).astype(X.dtype)
+        k = min(self.components + self.oversample, X.shape[1])
+        # Centered products without centering X: (X - mean) @ M = X @ M - mean @ M
+        def times(M):
+            return X @ M - mean @ M
+        def timesT(Q):
+            return X.T @ Q - np.outer(mean, Q.sum(axis=0))
+        Q = orthonormalize(times(rng.normal(size=(X.shape[1], k)).astype(X.dtype)))
+        for _ in range(self.powerIterations):
+            Q = orthonormalize(times(np.linalg.qr(timesT(Q))[0]))
+        _, s, vt = np.linalg.svd(timesT(Q).T, full_matrices=False)
+        self.mean_ = mean
+        self.components_ = vt[:self.components]
+        self.explainedVariance_ = s[:self.components] ** 2 / (len(X) - 1)
+
+    def transform(self, X):
+        return X @ self.components_.T - self.mean_ @ self.components_.T
+
+    def predict(self, X):
+        restored = self.transform(X) @ self.components_ + self.mean_
+        return ((X - restored) ** 2).sum(axis=1)
+
+class LinearModel(BaseModel):
+    releasesGil = True
+
+    def __init__(self, alpha=0.0, chunkSize=100_000):
+        super().__init__()
+        self.alpha = alpha
+        self.chunkSize = chunkSize
+
+    def fit(self, X, y):
+        d = X.shape[1]
+        gram = np.zeros((d + 1, d + 1))
+        moment = np.zeros(d + 1)
+        for rows in chunks(len(X), self.chunkSize):
+            block = X[rows].astype(np.float64)
+            target = y[rows].astype(np.float64)
+            # The last row / column of gram is the intercept's column of ones
+            gram[:d, :d] += block.T @ block
+            gram[:d, d] += block.sum(axis=0)
+            moment[:d] += block.T @ target
+            moment[d] += target.sum()
+        gram[d, :d] = gram[:d, d]
+        gram[d, d] = len(X)
+        gram[:d, :d] += self.alpha * np.eye(d)
+        weights = np.linalg.lstsq(gram, moment, rcond=None)[0]
+        self.coef_, self.intercept_ = weights[:d], weights[d]
+
+    def predict(self, X):
+        return X @ self.coef_.astype(X.dtype, copy=False) + X.dtype.type(self.intercept_)
+
+def sigmoid(z):
+    # Written with tanh so large |z| can't overflow exp
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+class LogisticModel(BaseModel):
+    releasesGil = True
+
+    def __init__(self, alpha=1e-6, maxIter=25, tol=1e-8, chunkSize=100_000):
+        super().__init__()
+        self.alpha = alpha
+        self.maxIter = maxIter
+        self.tol = tol
+        self.chunkSize = chunkSize
+
+    def fit(self, X, y):
+        d = X.shape[1]
+        w = np.zeros(d + 1)
+        for self.iterations_ in range(1, self.maxIter + 1):
+            # The intercept isn't penalized, the same as LinearModel and partial_fit
+            penalty = self.alpha * np.r_[np.ones(d), 0.0]
+            hessian = np.diag(penalty)
+            gradient = penalty * w
+            for rows in chunks(len(X), self.chunkSize):
+                block = X[rows].astype(np.float64)
+                p = sigmoid(block @ w[:d] + w[d])
+                error = p - y[rows]
+                weight = p * (1.0 - p)
+                weighted = block * weight[:, None]
+                hessian[:d, :d] += block.T @ weighted
+                hessian[:d, d] += weighted.sum(axis=0)
+                hessian[d, d] += weight.sum()
+                gradient[:d] += block.T @ error
+                gradient[d] += error.sum()
+            hessian[d, :d] = hessian[:d, d]
+            step = np.linalg.solve(hessian, gradient)
+            w -= step
+            if np.abs(step).max() < self.tol:
+                break
+        self.coef_, self.intercept_ = w[:d], w[d]
+
+    def predict_proba(self, X):
+        return sigmoid(X @ self.coef_.astype(X.dtype, copy=False) + X.dtype.type(self.intercept_))
+
+    def predict(self, X):
+        return (self.predict_proba(X) >= 0.5).astype(np.int8)
+
+# %% codecell
+rng = np.random.default_rng(1)
+Xs = rng.normal(loc=3.0, scale=[1, 2, 3, 4, 5], size=(50_000, 5))
+ys = Xs @ np.array([1.0, -2.0, 0.5, 0.0, 3.0]) + 4.0 + rng.normal(scale=0.1, size=50_000)
+labels = (ys > np.median(ys)).astype(np.int8)
+
+norm = Normalize(chunkSize=7_000)
+norm.fit(Xs)
+print(np.allclose(norm.mean_, Xs.mean(axis=0)), np.allclose(norm.scale_, Xs.std(axis=0)))
+
+pca = PCA(components=2)
+pca.fit(Xs)
+print(pca.explainedVariance_.round(2), np.linalg.eigvalsh(np.cov(Xs.T))[::-1][:2].round(2))
+
+linear = LinearModel()
+linear.fit(Xs, ys)
+print(linear.coef_.round(2), round(linear.intercept_, 2))
+
+logistic = LogisticModel()
+logistic.fit(Xs, labels)
+print('accuracy', (logistic.predict(Xs) == labels).mean(), 'iterations', logistic.iterations_)
+
+pipe = Pipeline()
+pipe.add(Normalize())
+pipe.add(PCA(components=4))
+pipe.add(LinearModel())
+pipe.fit(Xs, ys)
+print('pipeline r2', 1 - ((pipe.predict(Xs) - ys) ** 2).mean() / ys.var())
+
+# %% [md]
+# # Benchmark - 10k, 1M and 10M Rows
+# * 10 float32 features (10M rows is 400 MB of X)
+# * Fit time for each estimator, and the float32 X's size against float64
+
+# %% codecell
+def fitTime(estimator, X, y):
+    start = time.perf_counter()
+    estimator.fit(X, y)
+    return time.perf_counter() - start
+
+for rows in (10_000, 1_000_000, 10_000_000):
+    rng = np.random.default_rng(rows)
+    Xb = rng.normal(size=(rows, 10)).astype(np.float32)
+    yb = Xb @ rng.normal(size=10).astype(np.float32) + rng.normal(size=rows).astype(np.float32)
+    cb = (yb > 0).astype(np.int8)
+    times = [fitTime(Normalize(), Xb, yb), fitTime(PCA(components=3), Xb, yb),
+             fitTime(LinearModel(), Xb, yb), fitTime(LogisticModel(), Xb, cb)]
+    print(f'{rows:>10,} rows  X {Xb.nbytes / 1e6:7.1f} MB (float64 {2 * Xb.nbytes / 1e6:7.1f} MB)  '
+          + '  '.join(f'{name} {t:6.3f} s' for name, t in zip(('Normalize', 'PCA', 'Linear', 'Logistic'), times)))
+    del Xb, yb, cb
+
+# %% [md]
+# # Learning a Chunk at a Time - partial_fit
+# * fit assumes all of X is in memory at once
+# * partial_fit learns from one chunk and keeps what it learned from the chunks before
+# * Base declares partial_fit, so every transform and model inherits the contract
+# * Stream the chunks from disk, call partial_fit on each, and memory stays constant
+# * fit can then be written as: forget everything, partial_fit each chunk
+# * Normalize - merges each chunk's mean and variance into the totals (exact)
+# * PCA - incremental PCA: the SVD of the old components stacked on the new chunk
+#   * Component signs are fixed, so the steps after PCA see a consistent projection
+# * LinearModel - adds each chunk into X'X and X'y, so it matches the full fit exactly
+#   * Solving is O(d³), so partial_fit only adds - the weights are solved once, the next time coef_ is used
+# * LogisticModel - stochastic gradient descent, one small step per mini batch
+#   * The steps shrink as batches are seen - a fit counts as one pass over X, so partial_fit after fit only fine tunes
+# * Pipeline.partial_fit passes each chunk through the steps, each transform feeding the next
+
+# %% codecell
+class Normalize(BaseTransform):
+    releasesGil = True
+
+    def __init__(self, chunkSize=100_000):
+        self.chunkSize = chunkSize
+
+    def fit(self, X, y=None):
+        self._count = 0
+        for rows in chunks(len(X), self.chunkSize):
+            self.partial_fit(X[rows])
+
+    def partial_fit(self, X, y=None):
+        if getattr(self, '_count', 0) == 0:
+            self._count, self._mean, self._m2 = 0, np.zeros(X.shape[1]), np.zeros(X.shape[1])
+        block = X.astype(np.float64)
+        n = len(block)
+        blockMean = block.mean(axis=0)
+        blockM2 = ((block - blockMean) ** 2).sum(axis=0)
+        # Merge the chunk's statistics into the running totals (Chan et al.)
+        delta = blockMean - self._mean
+        total = self._count + n
+        self._mean = self._mean + delta * n / total
+        self._m2 = self._m2 + blockM2 + delta ** 2 * self._count * n / total
+        self._count = total
+        self.mean_ = self._mean
+        self.scale_ = np.sqrt(self._m2 / total)
+        self.scale_[self.scale_ == 0] = 1.0
+
+    def transform(self, X):
+        return (X - self.mean_.astype(X.dtype, copy=False)) / self.scale_.astype(X.dtype, copy=False)
+
+class PCA(BaseModel, BaseTransform):
+    releasesGil = True
+
+    def __init__(self, components=2, oversample=10, powerIterations=4, seed=0):
+        self.components = components
+        self.oversample = oversample
+        self.powerIterations = powerIterations
+        self.seed = seed
+
+    def fit(self, X, y=None):
+        rng = np.random.default_rng(self.seed)
+        mean = X.mean(axis=0, dtype=np.float64).astype(X.dtype)
+        k = min(self.components + self.oversample, X.shape[1])
+        # Centered products without centering X: (X - mean) @ M = X @ M - mean @ M
+        def times(M):
+            return X @ M - mean @ M
+        def timesT(Q):
+            return X.T @ Q - np.outer(mean, Q.sum(axis=0))
+        Q = orthonormalize(times(rng.normal(size=(X.shape[1], k)).astype(X.dtype)))
+        for _ in range(self.powerIterations):
+            Q = orthonormalize(times(np.linalg.qr(timesT(Q))[0]))
+        _, s, vt = np.linalg.svd(timesT(Q).T, full_matrices=False)
+        self._count = len(X)
+        self.mean_ = mean
+        self.components_ = vt[:self.components]
+        self.singularValues_ = s[:self.components]
+        self.explainedVariance_ = self.singularValues_ ** 2 / (len(X) - 1)
+
+    def partial_fit(self, X, y=None):
+        """
+        Incremental PCA (Ross et al.) - each chunk needs at least `components` rows.
+        """
+        block = X.astype(np.float64)
+        n = len(block)
+        blockMean = block.mean(axis=0)
+        count = getattr(self, '_count', 0)
+        if count == 0:
+            stacked = block - blockMean
+            mean = blockMean
+        else:
+            # Old components scaled by their singular values stand in for the old data,
+            # and the last row corrects for the shift in the mean
+            shift = np.sqrt(count * n / (count + n)) * (self.mean_ - blockMean)
+            stacked = np.vstack((self.singularValues_[:, None] * self.components_, block - blockMean, shift))
+            mean = self.mean_ + (blockMean - self.mean_) * n / (count + n)
+        _, s, vt = np.linalg.svd(stacked, full_matrices=False)
+        # Fix each component's sign so it can't flip from one chunk to the next
+        vt *= np.sign(vt[np.arange(len(vt)), np.abs(vt).argmax(axis=1)])[:, None]
+        self._count = count + n
+        self.mean_ = mean
+        self.components_ = vt[:self.components]
+        self.singularValues_ = s[:self.components]
+        self.explainedVariance_ = self.singularValues_ ** 2 / (self._count - 1)
+
+    def transform(self, X):
+        return X @ self.components_.T.astype(X.dtype, copy=False) - (self.mean_ @ self.components_.T).astype(X.dtype)
+
+    def predict(self, X):
+        restored = self.transform(X) @ self.components_ + self.mean_
+        return ((X - restored) ** 2).sum(axis=1)
+
+class LinearModel(BaseModel):
+    releasesGil = True
+
+    def __init__(self, alpha=0.0, chunkSize=100_000):
+        super().__init__()
+        self.alpha = alpha
+        self.chunkSize = chunkSize
+
+    def fit(self, X, y):
+        self._gram = None
+        for rows in chunks(len(X), self.chunkSize):
+            self._accumulate(X[rows], y[rows])
+        self._solve()
+
+    def partial_fit(self, X, y):
+        """
+        Add the chunk into X'X and X'y - the weights are solved when they are next used.
+        """
+        self._accumulate(X, y)
+        vars(self).pop('coef_', None)
+        vars(self).pop('intercept_', None)
+
+    def __getattr__(self, name):
+        # Only called for missing attributes - solve the weights the first time they're needed
+        if name in ('coef_', 'intercept_') and vars(self).get('_gram') is not None:
+            self._solve()
+            return vars(self)[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def _accumulate(self, X, y):
+        d = X.shape[1]
+        if getattr(self, '_gram', None) is None:
+            self._gram, self._moment = np.zeros((d + 1, d + 1)), np.zeros(d + 1)
+        block = X.astype(np.float64)
+        target = y.astype(np.float64)
+        # The last row / column of the gram matrix is the intercept's column of ones
+        self._gram[:d, :d] += block.T @ block
+        self._gram[:d, d] += block.sum(axis=0)
+        self._gram[d, :d] = self._gram[:d, d]
+        self._gram[d, d] += len(block)
+        self._moment[:d] += block.T @ target
+        self._moment[d] += target.sum()
+
+    def _solve(self):
+        d = len(self._moment) - 1
+        weights = np.linalg.lstsq(self._gram + self.alpha * np.diag(np.r_[np.ones(d), 0.0]),
+                                  self._moment, rcond=None)[0]
+        self.coef_, self.intercept_ = weights[:d], weights[d]
+
+    def predict(self, X):
+        return X @ self.coef_.astype(X.dtype, copy=False) + X.dtype.type(self.intercept_)
+
+class LogisticModel(BaseModel):
+    releasesGil = True
+
+    def __init__(self, alpha=1e-6, maxIter=25, tol=1e-8, chunkSize=100_000, learningRate=0.5, batchSize=256):
+        super().__init__()
+        self.alpha = alpha
+        self.maxIter = maxIter
+        self.tol = tol
+        self.chunkSize = chunkSize
+        self.learningRate = learningRate
+        self.batchSize = batchSize
+
+    def fit(self, X, y):
+        d = X.shape[1]
+        w = np.zeros(d + 1)
+        for self.iterations_ in range(1, self.maxIter + 1):
+            # The intercept isn't penalized, the same as LinearModel and partial_fit
+            penalty = self.alpha * np.r_[np.ones(d), 0.0]
+            hessian = np.diag(penalty)
+            gradient = penalty * w
+            for rows in chunks(len(X), self.chunkSize):
+                block = X[rows].astype(np.float64)
+                p = sigmoid(block @ w[:d] + w[d])
+                error = p - y[rows]
+                weight = p * (1.0 - p)
+                weighted = block * weight[:, None]
+                hessian[:d, :d] += block.T @ weighted
+                hessian[:d, d] += weighted.sum(axis=0)
+                hessian[d, d] += weight.sum()
+                gradient[:d] += block.T @ error
+                gradient[d] += error.sum()
+            hessian[d, :d] = hessian[:d, d]
+            step = np.linalg.solve(hessian, gradient)
+            w -= step
+            if np.abs(step).max() < self.tol:
+                break
+        self.coef_, self.intercept_ = w[:d], w[d]
+        # A converged fit counts as a pass of SGD batches over X, so partial_fit carries on with small steps
+        self._steps = -(-len(X) // self.batchSize)
+
+    def partial_fit(self, X, y):
+        """
+        Mini batch SGD with a decaying learning rate; vectorized within each batch.
+        """
+        if getattr(self, 'coef_', None) is None:
+            self.coef_, self.intercept_, self._steps = np.zeros(X.shape[1]), 0.0, 0
+        for rows in chunks(len(X), self.batchSize):
+            block = X[rows].astype(np.float64)
+            error = sigmoid(block @ self.coef_ + self.intercept_) - y[rows]
+            rate = self.learningRate / np.sqrt(1.0 + self._steps)
+            self.coef_ = self.coef_ - rate * (block.T @ error / len(block) + self.alpha * self.coef_)
+            self.intercept_ = self.intercept_ - rate * error.mean()
+            self._steps += 1
+
+    def predict_proba(self, X):
+        return sigmoid(X @ self.coef_.astype(X.dtype, copy=False) + X.dtype.type(self.intercept_))
+
+    def predict(self, X):
+        return (self.predict_proba(X) >= 0.5).astype(np.int8)
+
+# %% codecell
+class Pipeline(Pipeline):
+    """
+    Pipeline with partial_fit.
+    """
+    def partial_fit(self, X, y):
+        """
+        Learn from one chunk: each step learns from it, and each transform passes it on.
+        """
+        for i, obj in enumerate(self.steps):
+            if isinstance(obj, Base):
+                try:
+                    obj.partial_fit(X, y)
+                except Exception as exc:
+                    raise StepError(i, obj, 'partial_fit') from exc
+            if isinstance(obj, BaseTransform):
+                X = self._apply(i, obj, 'transform', X)
+
+# %% [md]
+# # Checking partial_fit Against fit
+# * 200k rows streamed in 10k row chunks, compared with one fit on all rows
+
+# %% codecell
+rng = np.random.default_rng(2)
+Xs = rng.normal(loc=3.0, scale=[1, 2, 3, 4, 5], size=(200_000, 5))
+ys = Xs @ np.array([1.0, -2.0, 0.5, 0.0, 3.0]) + 4.0 + rng.normal(scale=0.1, size=200_000)
+labels = (ys > np.median(ys)).astype(np.int8)
+
+def streamFit(estimator, X, y, chunkSize=10_000, epochs=1):
+    for _ in range(epochs):
+        for rows in chunks(len(X), chunkSize):
+            estimator.partial_fit(X[rows], y[rows])
+    return estimator
+
+full, streamed = Normalize(), streamFit(Normalize(), Xs, ys)
+full.fit(Xs)
+print('Normalize mean, scale', np.allclose(full.mean_, streamed.mean_), np.allclose(full.scale_, streamed.scale_))
+
+full, streamed = PCA(components=2), streamFit(PCA(components=2), Xs, ys)
+full.fit(Xs)
+print('PCA variance', full.explainedVariance_.round(3), streamed.explainedVariance_.round(3),
+      'component agreement', np.abs((full.components_ * streamed.components_).sum(axis=1)).round(6))
+
+full, streamed = LinearModel(), streamFit(LinearModel(), Xs, ys)
+full.fit(Xs, ys)
+print('Linear coef', np.allclose(full.coef_, streamed.coef_), np.isclose(full.intercept_, streamed.intercept_))
+
+scaled = Normalize()
+scaled.fit(Xs)
+Xn = scaled.transform(Xs)
+full, streamed = LogisticModel(), streamFit(LogisticModel(), Xn, labels, epochs=3)
+full.fit(Xn, labels)
+print('Logistic accuracy', (full.predict(Xn) == labels).mean(), (streamed.predict(Xn) == labels).mean(),
+      'prediction agreement', (full.predict(Xn) == streamed.predict(Xn)).mean())
+
+before = full.coef_.copy()
+full.partial_fit(Xn[:10_000], labels[:10_000])
+print('Logistic partial_fit after fit, largest coef change', np.abs(full.coef_ - before).max().round(4),
+      'of', np.abs(before).max().round(2))
+
+wide = rng.normal(size=(20_000, 1_000))
+start = time.perf_counter()
+model = streamFit(LinearModel(), wide, wide @ rng.normal(size=1_000), chunkSize=1_000)
+model.coef_
+print(f'LinearModel, 20 chunks of 1,000 features {time.perf_counter() - start:.2f} s')
+
+# %% [md]
+# A whole pipeline learning from a stream of chunks.
+# Steps after a transform learn from its output while the transform is still learning,
+# so a streamed pipeline comes close to the full fit once the early steps settle.
+
+# %% codecell
+def pipeline():
+    pipe = Pipeline()
+    pipe.add(Normalize())
+    pipe.add(LinearModel())
+    return pipe
+
+full, streamed = pipeline(), pipeline()
+full.fit(Xs, ys)
+for rows in chunks(len(Xs), 10_000):
+    streamed.partial_fit(Xs[rows], ys[rows])
+for name, pipe in (('full', full), ('streamed', streamed)):
+    print(f'{name:<9} pipeline r2 {1 - ((pipe.predict(Xs) - ys) ** 2).mean() / ys.var():.6f}')
+
+# %% [md]
+# # Compiling a Pipeline
+# * Normalize, PCA and LinearModel are all affine: X @ W + b
+# * Run one after another, each makes its own intermediate array
+# * An affine step after an affine step is still affine:
+#   (X @ W1 + b1) @ W2 + b2 = X @ (W1 @ W2) + (b1 @ W2 + b2)
+# * compile() folds the steps into one matrix and one bias, so predict is a single matmul
+# * LogisticModel is affine up to its last step: p >= 0.5 exactly when X @ w + b >= 0
+# * affine() is a single dispatch function - each class registers how to express itself as (W, b)
+# * A step with no registered form can't be folded, and compile says which step it is
+# * PCA's affine form is its projection, but its predict is the reconstruction error - a pipeline predicting with PCA can't be compiled
+
+# %% codecell
+from functools import singledispatch
+
+@singledispatch
+def affine(step):
+    """
+    The (W, b) for which step's output is X @ W + b, or None if the step isn't affine.
+    """
+    return None
+
+@affine.register
+def _(step: Normalize):
+    return np.diag(1.0 / step.scale_), -step.mean_ / step.scale_
+
+@affine.register
+def _(step: PCA):
+    return step.components_.T, -step.mean_ @ step.components_.T
+
+@affine.register
+def _(step: LinearModel):
+    return step.coef_[:, None], np.array([step.intercept_])
+
+@affine.register
+def _(step: LogisticModel):
+    return step.coef_[:, None], np.array([step.intercept_])
+
+class CompiledPipeline():
+    """
+    A fitted pipeline folded into predict(X) = X @ weights + bias.
+    threshold turns the scores into 0 / 1 labels (used for LogisticModel).
+    """
+    def __init__(self, weights, bias, threshold=False):
+        self.weights = weights
+        self.bias = bias
+        self.threshold = threshold
+        self._cast = {}
+
+    def _params(self, dtype):
+        # Weights cast to X's dtype once, so float32 X isn't upcast on every call
+        if dtype not in self._cast:
+            self._cast[dtype] = (self.weights.astype(dtype), self.bias.astype(dtype))
+        return self._cast[dtype]
+
+    def predict(self, X):
+        weights, bias = self._params(X.dtype)
+        out = X @ weights
+        out += bias
+        if out.shape[-1] == 1:
+            # One output per row - a single row (1-D X) gives a scalar, like Pipeline.predict
+            out = out[:, 0] if out.ndim == 2 else out[0]
+        if self.threshold:
+            return (out >= 0).astype(np.int8)
+        return out
+
+class Pipeline(Pipeline):
+    """
+    Pipeline with compile.
+    """
+    def _predictPath(self):
+        """
+        The steps predict runs, in order: the transforms before the predicting model, then the model.
+        """
+        last = self._predictor()
+        path = [(i, obj) for i, obj in enumerate(self.steps[:last]) if isinstance(obj, BaseTransform)]
+        path.append((last, self.steps[last]))
+        return path
+
+    def _affinePath(self):
+        """
+        The predict path, when every step on it predicts with its affine form.
+        """
+        path = self._predictPath()
+        last, model = path[-1]
+        if isinstance(model, BaseTransform):
+            # A model that is also a transform (PCA) predicts something other than its affine form
+            raise ValueError(f'Step {last} ({model.__class__.__name__}) is not affine as a predictor and cannot be compiled')
+        return path
+
+    def compile(self):
+        """
+        Fold the fitted transforms and the predicting model into one CompiledPipeline.
+        """
+        path = self._affinePath()
+        weights, bias = None, None
+        for i, obj in path:
+            form = affine(obj)
+            if form is None:
+                raise ValueError(f'Step {i} ({obj.__class__.__name__}) is not affine and cannot be compiled')
+            W, b = form
+            if weights is None:
+                weights, bias = W, b
+            else:
+                weights, bias = weights @ W, bias @ W + b
+        return CompiledPipeline(weights, bias, threshold=isinstance(path[-1][1], LogisticModel))
+
+# %% codecell
+rng = np.random.default_rng(3)
+Xc = rng.normal(size=(100_000, 50)) @ rng.normal(size=(50, 50))
+yc = Xc @ rng.normal(size=50) + rng.normal(size=100_000)
+
+pipe = Pipeline()
+pipe.add(Normalize())
+pipe.add(PCA(components=20))
+pipe.add(LinearModel())
+pipe.fit(Xc, yc)
+compiled = pipe.compile()
+print(compiled.weights.shape, np.allclose(pipe.predict(Xc), compiled.predict(Xc)),
+      'single row', np.isclose(pipe.predict(Xc[0]), compiled.predict(Xc[0])))
+
+classify = Pipeline()
+classify.add(Normalize())
+classify.add(LogisticModel())
+classify.fit(Xc, (yc > 0).astype(np.int8))
+print('labels agree', (classify.predict(Xc) == classify.compile().predict(Xc)).mean(),
+      'single row', classify.predict(Xc[0]) == classify.compile().predict(Xc[0]))
+
+reduce = Pipeline()
+reduce.add(Normalize())
+reduce.add(PCA(components=2))
+reduce.fit(Xc[:1_000], yc[:1_000])
+try:
+    reduce.compile()
+except ValueError as exc:
+    print(exc)
+
+# %% [md]
+# # Benchmark - Predict Latency and Allocations
+# * 100k x 50 float64 rows through Normalize, PCA(20) and LinearModel
+# * Allocated bytes is tracemalloc's peak during one predict
+
+# %% codecell
+def latency(func, X, repeat=20):
+    func(X)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(X)
+    return (time.perf_counter() - start) / repeat * 1e3
+
+def allocated(func, X):
+    tracemalloc.start()
+    func(X)
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size / 1e6
+
+for name, func in (('pipeline', pipe.predict), ('compiled', compiled.predict)):
+    for rows in (1, 1_000, 100_000):
+        print(f'{name:<9} {rows:>7,} rows {latency(func, Xc[:rows]):9.3f} ms {allocated(func, Xc[:rows]):8.2f} MB')
+
+# %% [md]
+# # Single Row Predictions - InferencePlan
+# * A serving layer calls predict with one row at a time
+# * For one row, the work is tiny and the overhead is everything:
+#   isinstance checks on every step, new arrays for every step's output
+# * An InferencePlan does the bookkeeping once, when it is built:
+#   * decides which steps run (the transforms before the model, then the model)
+#   * turns each step into an affine (W, b) cast to the row dtype
+#   * diagonal W (Normalize) becomes an elementwise multiply
+#   * preallocates one output buffer per step, written in place with out=
+# * predict_one(x) then just runs the prepared operations
+# * fold=True uses compile() to collapse the plan to a single step
+# * Buffers are reused, so a plan is not thread safe - use one plan per thread
+
+# %% codecell
+class InferencePlan():
+    """
+    A prepared single row predict path for a fitted Pipeline.
+    """
+    def __init__(self, pipeline, dtype=np.float64, fold=False):
+        self.dtype = np.dtype(dtype)
+        path = pipeline._affinePath()
+        last, model = path[-1]
+        self.threshold = isinstance(model, LogisticModel)
+        if fold:
+            compiled = pipeline.compile()
+            forms = [(last, model, (compiled.weights, compiled.bias))]
+        else:
+            forms = [(i, obj, affine(obj)) for i, obj in path]
+        self.ops = []
+        for i, obj, form in forms:
+            if form is None:
+                raise ValueError(f'Step {i} ({obj.__class__.__name__}) is not affine and has no single row path')
+            W, b = form
+            b = b.astype(self.dtype)
+            if W.shape[0] == W.shape[1] and np.count_nonzero(W - np.diag(np.diag(W))) == 0:
+                self.ops.append((None, np.diag(W).astype(self.dtype), b, np.empty(len(b), self.dtype)))
+            else:
+                self.ops.append((np.ascontiguousarray(W, dtype=self.dtype), None, b, np.empty(len(b), self.dtype)))
+
+    def predict_one(self, x):
+        for W, scale, b, out in self.ops:
+            if W is None:
+                np.multiply(x, scale, out=out)
+            else:
+                np.dot(x, W, out=out)
+            np.add(out, b, out=out)
+            x = out
+        if self.threshold:
+            return int(x[0] >= 0)
+        return x[0] if len(x) == 1 else x.copy()
+
+# %% codecell
+plan = InferencePlan(pipe)
+row = Xc[0]
+print(plan.predict_one(row), pipe.predict(Xc[:1])[0], InferencePlan(pipe, fold=True).predict_one(row))
+print(InferencePlan(classify).predict_one(row), classify.predict(Xc[:1])[0])
+try:
+    InferencePlan(reduce)
+except ValueError as exc:
+    print(exc)
+
+# %% [md]
+# # Benchmark - Single Row Latency
+# * Pipelines of 1, 10 and 100 steps (Normalize steps feeding a LinearModel)
+# * p50 and p99 latency over 20k single row calls, in microseconds
+
+# %% codecell
+def percentiles(func, rows):
+    times = np.empty(len(rows))
+    clock = time.perf_counter_ns
+    for r in rows[:1000]:
+        func(r)   # warm up
+    for i, r in enumerate(rows):
+        start = clock()
+        func(r)
+        times[i] = clock() - start
+    return np.percentile(times / 1e3, [50, 99])
+
+Xr = rng.normal(size=(20_000, 20))
+yr = Xr @ rng.normal(size=20)
+for steps in (1, 10, 100):
+    deep = Pipeline()
+    for _ in range(steps - 1):
+        deep.add(Normalize())
+    deep.add(LinearModel())
+    deep.fit(Xr, yr)
+    plan, folded = InferencePlan(deep), InferencePlan(deep, fold=True)
+    for name, func in (('predict', lambda r: deep.predict(r[None, :])), ('predict_one', plan.predict_one),
+                       ('predict_one fold', folded.predict_one)):
+        p50, p99 = percentiles(func, Xr)
+        print(f'{steps:>3} steps  {name:<17} p50 {p50:8.2f} us  p99 {p99:8.2f} us')
+
+# %% [md]
+# # Micro Batching Concurrent Requests
+# * Many request handlers each calling predict with one row waste the vectorized path
+# * One predict on 100 rows costs about the same as one predict on 1 row
+# * BatchingPredictor collects rows from concurrent callers:
+#   * a batch is sent once it has maxRows rows, or maxDelay seconds after its first row arrived
+#   * one predict runs on the whole batch, and each caller's future gets its own row's result
+#   * if predict raises, every caller in that batch gets the exception
+# * By default predict runs on the event loop; pass an executor to run it in a thread
+#   (NumPy releases the GIL, so the loop keeps accepting requests meanwhile)
+
+# %% codecell
+import asyncio
+
+class BatchingPredictor():
+    """
+    Awaitable single row predictions, served by batched calls to predict.
+    """
+    def __init__(self, predict, maxRows=128, maxDelay=0.001, executor=None):
+        self.predict = predict
+        self.maxRows = maxRows
+        self.maxDelay = maxDelay
+        self.executor = executor
+        self.batches = 0
+        self._pending = []
+        self._timer = None
+
+    async def predict_one(self, row):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= self.maxRows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.maxDelay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        self.batches += 1
+        futures = [future for _, future in pending]
+        try:
+            # A row with the wrong shape fails the stack - every caller in the batch gets the error
+            X = np.stack([row for row, _ in pending])
+            if self.executor is None:
+                self._resolve(futures, self.predict(X), None)
+                return
+            work = asyncio.get_running_loop().run_in_executor(self.executor, self.predict, X)
+        except Exception as exc:
+            self._resolve(futures, None, exc)
+            return
+        work.add_done_callback(lambda done: self._finished(futures, done))
+
+    def _finished(self, futures, done):
+        if done.cancelled():
+            for future in futures:
+                future.cancel()
+        elif done.exception() is not None:
+            self._resolve(futures, None, done.exception())
+        else:
+            self._resolve(futures, done.result(), None)
+
+    @staticmethod
+    def _resolve(futures, predictions, error):
+        for i, future in enumerate(futures):
+            if future.done():
+                continue   # the caller gave up (cancelled)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(predictions[i])
+
+# %% [md]
+# A notebook already runs an event loop, so asyncio.run can't be called from a cell.
+# runAsync runs a coroutine on a fresh loop in a helper thread, which works in a notebook and in a script.
+
+# %% codecell
+def runAsync(coroutine):
+    with ThreadPoolExecutor(1) as thread:
+        return thread.submit(asyncio.run, coroutine).result()
+
+async def demo():
+    batcher = BatchingPredictor(pipe.predict)
+    results = await asyncio.gather(*(batcher.predict_one(row) for row in Xc[:5]))
+    return results, batcher.batches
+
+results, batches = runAsync(demo())
+print(np.round(results, 3), pipe.predict(Xc[:5]).round(3), 'batches', batches)
+
+async def badRow():
+    batcher = BatchingPredictor(pipe.predict)
+    return await asyncio.gather(batcher.predict_one(Xc[0]), batcher.predict_one(Xc[1, :3]), return_exceptions=True)
+
+print(runAsync(badRow()))
+
+# %% [md]
+# # Load Test - Per Request vs Batched
+# * 200 concurrent clients, each sending requests one after another, 20k requests in all
+# * Per request: each handler calls pipe.predict on its own row
+# * Batched: each handler awaits BatchingPredictor.predict_one
+# * Latency is measured from the client's side, from sending to receiving the answer
+
+# %% codecell
+async def loadTest(handler, clients=200, requests=20_000):
+    latencies = []
+    rows = iter(range(requests))
+    clock = time.perf_counter
+
+    async def client():
+        for i in rows:
+            start = clock()
+            await handler(Xc[i % len(Xc)])
+            latencies.append(clock() - start)
+
+    start = clock()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = clock() - start
+    p50, p99 = np.percentile(np.array(latencies) * 1e3, [50, 99])
+    return requests / elapsed, p50, p99
+
+async def perRequest(row):
+    await asyncio.sleep(0)   # hand control back to the loop, as a real handler would
+    return pipe.predict(row[None, :])[0]
+
+async def runLoadTests():
+    results = {'per request': await loadTest(perRequest)}
+    for maxRows in (32, 128, 512):
+        batcher = BatchingPredictor(pipe.predict, maxRows=maxRows, maxDelay=0.002)
+        results[f'batched maxRows={maxRows}'] = await loadTest(batcher.predict_one)
+    return results
+
+for name, (throughput, p50, p99) in runAsync(runLoadTests()).items():
+    print(f'{name:<22} {throughput:10,.0f} req/s   p50 {p50:7.2f} ms   p99 {p99:7.2f} ms')
+
+# %% [md]
+# # Saving a Pipeline - Memory Mapped Weights
+# * pickle copies every weight array into the file, and every worker copies it back out on load
+# * savePipeline writes the metadata (step classes and parameters) to pipeline.json
+#   and each array the step holds (fitted weights like components_) to its own .npy file
+# * loadPipeline opens the .npy files with numpy.memmap (np.load with mmap_mode='r')
+#   * nothing is read at load time - pages are read from the OS page cache when first used
+#   * every process that maps the same file shares the same physical pages
+# * Memory mapped arrays are read only - predict works, refit a copy if you need to
+#   * Private running totals (LinearModel's _gram and _moment) are loaded into memory, so partial_fit still works
+#   * Steps cast weights with astype(copy=False), so predicting in the weights' dtype reads the shared pages instead of copying them
+# * Step classes are looked up by module and name when loading, so they must be defined
+
+# %% codecell
+import json
+import sys
+
+def savePipeline(pipeline, directory):
+    os.makedirs(directory, exist_ok=True)
+    steps = []
+    for i, step in enumerate(pipeline.steps):
+        params, arrays = {}, {}
+        for name, value in vars(step).items():
+            if isinstance(value, np.ndarray):
+                filename = f'step{i}.{name}.npy'
+                np.save(os.path.join(directory, filename), np.ascontiguousarray(value))
+                arrays[name] = filename
+            else:
+                params[name] = value.item() if isinstance(value, np.generic) else value
+        steps.append({'module': type(step).__module__, 'class': type(step).__qualname__,
+                      'params': params, 'arrays': arrays})
+    with open(os.path.join(directory, 'pipeline.json'), 'w') as f:
+        json.dump({'n_jobs': pipeline.n_jobs, 'steps': steps}, f, indent=2)
+
+def loadPipeline(directory, mmap=True):
+    with open(os.path.join(directory, 'pipeline.json')) as f:
+        meta = json.load(f)
+    pipeline = Pipeline(n_jobs=meta['n_jobs'])
+    for spec in meta['steps']:
+        cls = getattr(sys.modules[spec['module']], spec['class'])
+        step = cls.__new__(cls)   # skip __init__ - the saved state is restored directly
+        vars(step).update(spec['params'])
+        for name, filename in spec['arrays'].items():
+            # Private arrays are running totals that partial_fit updates in place, so they get a private copy
+            mode = 'r' if mmap and not name.startswith('_') else None
+            setattr(step, name, np.load(os.path.join(directory, filename), mmap_mode=mode))
+        pipeline.add(step)
+    return pipeline
+
+# %% codecell
+modelDir = os.path.join(tempfile.gettempdir(), 'pipeline-model')
+savePipeline(pipe, modelDir)
+loaded = loadPipeline(modelDir)
+print(sorted(os.listdir(modelDir)))
+print(type(loaded.steps[1].components_).__name__, np.allclose(loaded.predict(Xc[:100]), pipe.predict(Xc[:100])))
+loaded.partial_fit(Xc[:100], yc[:100])
+
+# %% [md]
+# # Benchmark - 8 Workers Loading a Large Pipeline
+# * A PCA step with 100 MB of components stands in for a large fitted model
+# * 8 worker processes load it at the same time and predict one row (which reads every weight)
+# * Memory is read from /proc/self/smaps_rollup (Linux) before loading and after predicting:
+#   * Rss counts every page the process uses, shared or not
+#   * Pss splits shared pages between the processes sharing them - summing Pss gives the real total
+
+# %% codecell
+import multiprocessing
+
+def smaps():
+    with open('/proc/self/smaps_rollup') as f:
+        fields = dict(line.split(':', 1) for line in f if ':' in line and not line.startswith(' '))
+    return {k: int(v.split()[0]) / 1024 for k, v in fields.items() if k in ('Rss', 'Pss')}
+
+def worker(load, path, row, barrier, results):
+    barrier.wait()
+    before = smaps()
+    start = time.perf_counter()
+    model = load(path)
+    loadSeconds = time.perf_counter() - start
+    model.predict(row)
+    barrier.wait()   # every worker holds its model before memory is measured
+    after = smaps()
+    barrier.wait()
+    results.put((loadSeconds, after['Rss'] - before['Rss'], after['Pss'] - before['Pss']))
+
+def pickleLoad(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def benchmarkWorkers(load, path, workers=8):
+    context = multiprocessing.get_context('fork')
+    barrier, results = context.Barrier(workers), context.Queue()
+    row = np.zeros((1, big.steps[0].mean_.shape[0]))
+    processes = [context.Process(target=worker, args=(load, path, row, barrier, results)) for _ in range(workers)]
+    for p in processes:
+        p.start()
+    stats = [results.get() for _ in processes]
+    for p in processes:
+        p.join()
+    loads, rss, pss = zip(*stats)
+    return np.mean(loads), np.mean(rss), sum(pss)
+
+d, k = 12_500, 1_000
+big = Pipeline()
+pca = PCA(components=k)
+pca.mean_ = np.zeros(d)
+pca.components_ = np.random.default_rng(0).normal(size=(k, d)) / np.sqrt(d)   # 100 MB
+big.add(pca)
+
+pickleFile = os.path.join(tempfile.gettempdir(), 'pipeline-model.pkl')
+with open(pickleFile, 'wb') as f:
+    pickle.dump(big, f)
+bigDir = os.path.join(tempfile.gettempdir(), 'pipeline-model-big')
+savePipeline(big, bigDir)
+del pca
+
+for name, load, path in (('pickle', pickleLoad, pickleFile), ('memmap', loadPipeline, bigDir)):
+    seconds, rss, pss = benchmarkWorkers(load, path)
+    print(f'{name:<7} load {seconds * 1e3:8.2f} ms   Rss added per worker {rss:7.1f} MB   '
+          f'Pss added by all 8 {pss:7.1f} MB')
+
+# %% [md]
+# # Profiling Pipeline Steps
+# * Which step dominates a run - Normalize, PCA or the model?
+# * A Profiler handed to the Pipeline measures every fit, partial_fit, transform and predict call:
+#   * wall time and CPU time
+#   * peak memory during the call and bytes still allocated after it (from tracemalloc)
+#   * input and output shapes, and the output's size in bytes
+# * report() totals the calls per step; records holds every call
+# * trace() writes a Chrome trace file - open it in chrome://tracing, Perfetto or speedscope for a flame graph
+# * Every step call already goes through Pipeline._apply, so that's the one place to measure
+# * With no profiler, the only cost is one "is None" check per step call
+# * The Profiler is also a context manager: inside the with block tracemalloc is running
+
+# %% codecell
+import json
+import tracemalloc
+
+class Profiler():
+    """
+    Records per step measurements for a Pipeline.
+    """
+    def __init__(self):
+        self.records = []
+        self._origin = time.perf_counter()
+        self._startedTracing = False
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._startedTracing = True
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._startedTracing:
+            tracemalloc.stop()
+            self._startedTracing = False
+        return False
+
+    def run(self, i, step, action, X, *args):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.process_time()
+        out = getattr(step, action)(X, *args)
+        end = time.perf_counter()
+        record = {
+            'step': i,
+            'name': step.__class__.__name__,
+            'action': action,
+            'start': wall - self._origin,
+            'wall': end - wall,
+            'cpu': time.process_time() - cpu,
+            'peakBytes': None,
+            'allocatedBytes': None,
+            'inputShape': getattr(X, 'shape', None),
+            'outputShape': getattr(out, 'shape', None),
+            'outputBytes': getattr(out, 'nbytes', None),
+        }
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            record['peakBytes'] = peak - before
+            record['allocatedBytes'] = current - before
+        self.records.append(record)
+        return out
+
+    def report(self):
+        """
+        Totals per step and action, slowest first.
+        """
+        totals = {}
+        for r in self.records:
+            key = (r['step'], r['name'], r['action'])
+            t = totals.setdefault(key, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peakBytes': 0})
+            t['calls'] += 1
+            t['wall'] += r['wall']
+            t['cpu'] += r['cpu']
+            t['peakBytes'] = max(t['peakBytes'], r['peakBytes'] or 0)
+        lines = [f'{"step":<18} {"action":<12} {"calls":>6} {"wall s":>9} {"cpu s":>9} {"peak MB":>9}']
+        for (i, name, action), t in sorted(totals.items(), key=lambda kv: -kv[1]['wall']):
+            lines.append(f'{f"{i} {name}":<18} {action:<12} {t["calls"]:>6} {t["wall"]:>9.4f} '
+                         f'{t["cpu"]:>9.4f} {t["peakBytes"] / 1e6:>9.2f}')
+        return '\n'.join(lines)
+
+    def trace(self, path):
+        """
+        Write the calls as a Chrome trace (Trace Event Format) JSON file.
+        """
+        events = [{'name': f'{r["step"]} {r["name"]}.{r["action"]}', 'cat': r['action'], 'ph': 'X',
+                   'ts': r['start'] * 1e6, 'dur': r['wall'] * 1e6, 'pid': os.getpid(), 'tid': 0,
+                   'args': {k: str(v) for k, v in r.items() if k not in ('start', 'wall')}}
+                  for r in self.records]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+# %% codecell
+class Pipeline(Pipeline):
+    """
+    Pipeline whose step calls can be measured by a Profiler.
+    """
+    def __init__(self, n_jobs=1, profiler=None):
+        """
+        n_jobs is the number of side by side models fitted at once, -1 uses every core.
+        profiler, when set, measures every step call (see Profiler).
+        """
+        super().__init__(n_jobs=n_jobs)
+        self.profiler = profiler
+
+    def partial_fit(self, X, y):
+        """
+        Learn from one chunk: each step learns from it, and each transform passes it on.
+        """
+        for i, obj in enumerate(self.steps):
+            if isinstance(obj, Base):
+                self._apply(i, obj, 'partial_fit', X, y)
+            if isinstance(obj, BaseTransform):
+                X = self._apply(i, obj, 'transform', X)
+
+    def _apply(self, i, obj, action, X, *args):
+        try:
+            if self.profiler is None:
+                return getattr(obj, action)(X, *args)
+            return self.profiler.run(i, obj, action, X, *args)
+        except Exception as exc:
+            raise StepError(i, obj, action) from exc
+
+    def _fitModels(self, steps, X, y):
+        # While profiling, steps are fitted one at a time so each measurement is the step's own
+        if self.profiler is None:
+            return super()._fitModels(steps, X, y)
+        for i, obj in steps:
+            self._apply(i, obj, 'fit', X, y)
+
+# %% codecell
+with Profiler() as profiler:
+    pipe = Pipeline(profiler=profiler)
+    pipe.add(Normalize())
+    pipe.add(PCA(components=20))
+    pipe.add(LinearModel())
+    pipe.fit(Xc, yc)
+    for _ in range(5):
+        pipe.predict(Xc)
+
+print(profiler.report())
+print(profiler.records[0])
+traceFile = os.path.join(tempfile.gettempdir(), 'pipeline-trace.json')
+profiler.trace(traceFile)
+
+# %% [md]
+# # Benchmark - Profiling Overhead
+# * Single row predicts (where any overhead would show most), without and with a profiler
+
+# %% codecell
+def perCall(pipe, rows=5_000):
+    row = Xc[:1]
+    start = time.perf_counter()
+    for _ in range(rows):
+        pipe.predict(row)
+    return (time.perf_counter() - start) / rows * 1e6
+
+pipe.profiler = None
+print(f'no profiler              {perCall(pipe):7.2f} us per predict')
+pipe.profiler = Profiler()
+print(f'profiler, time only      {perCall(pipe):7.2f} us per predict')
+with Profiler() as pipe.profiler:
+    print(f'profiler, with memory    {perCall(pipe):7.2f} us per predict')
+pipe.profiler = None
+
+# %% [md]
+# # Caching Roles - A Capability Registry
+# * Every Pipeline loop asks each step "are you a transform? a model?" with isinstance
+# * isinstance searches the class's MRO each time it's asked
+# * With deep multiple inheritance trees and millions of checks, the same answers are worked out again and again
+# * A step's roles only depend on its class, and a class's MRO doesn't change
+# * roles() works out a class's roles once from its MRO, keeps them as bit flags in a dict keyed by type,
+#   and answers every later question with one dict lookup
+# * PCA(BaseModel, BaseTransform) gets both flags: MODEL | TRANSFORM
+# * roles() is still a Python function call, and one Python call costs more than one isinstance (written in C)
+#   * So calling roles() in every loop would make short MROs slower, not faster
+#   * Instead a Pipeline asks roles() once per step, in add, and keeps the flags in stepRoles beside steps
+#   * Every loop - fit, partial_fit, transform, predict, compile - then reads the flags with no call at all
+# * CachedPipeline is mixed in with the new Pipeline, so its fit reads stepRoles too
+
+# %% codecell
+FITTABLE, TRANSFORM, MODEL = 1, 2, 4
+ROLE_BASES = ((Base, FITTABLE), (BaseTransform, TRANSFORM), (BaseModel, MODEL))
+_roleCache = {}
+
+def roles(obj):
+    """
+    Bit flags for the roles of obj's class: FITTABLE, TRANSFORM and MODEL.
+    """
+    cls = type(obj)
+    try:
+        return _roleCache[cls]
+    except KeyError:
+        mro = set(cls.__mro__)
+        flags = 0
+        for base, flag in ROLE_BASES:
+            if base in mro:
+                flags |= flag
+        _roleCache[cls] = flags
+        return flags
+
+# %% codecell
+print(roles(Normalize()), roles(PCA()) == MODEL | TRANSFORM | FITTABLE, roles(LinearModel()) & TRANSFORM)
+
+# Kept to compare against below
+IsinstancePipeline = Pipeline
+
+# %% codecell
+class Pipeline(IsinstancePipeline):
+    """
+    Pipeline that works out each step's roles once, when the step is added, and keeps them in stepRoles.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stepRoles = []
+
+    def add(self, step):
+        super().add(step)
+        self.stepRoles.append(roles(step))
+
+    def fit(self, X, y):
+        models = []
+        for i, stepRoles in enumerate(self.stepRoles):
+            if stepRoles & TRANSFORM:
+                self._fitModels(models, X, y)
+                models = []
+                self._fitModels([(i, self.steps[i])], X, y)
+                X = self._apply(i, self.steps[i], 'transform', X)
+            elif stepRoles & FITTABLE:
+                models.append((i, self.steps[i]))
+        self._fitModels(models, X, y)
+
+    def partial_fit(self, X, y):
+        """
+        Learn from one chunk: each step learns from it, and each transform passes it on.
+        """
+        for i, stepRoles in enumerate(self.stepRoles):
+            if stepRoles & FITTABLE:
+                self._apply(i, self.steps[i], 'partial_fit', X, y)
+            if stepRoles & TRANSFORM:
+                X = self._apply(i, self.steps[i], 'transform', X)
+
+    def transform(self, X):
+        for i, stepRoles in enumerate(self.stepRoles):
+            if stepRoles & TRANSFORM:
+                X = self._apply(i, self.steps[i], 'transform', X)
+        return X
+
+    def _predictor(self):
+        """
+        Index of the step that makes predictions: the last model that isn't also a transform.
+        """
+        models = [i for i, stepRoles in enumerate(self.stepRoles) if stepRoles & MODEL]
+        plain = [i for i in models if not self.stepRoles[i] & TRANSFORM]
+        if not models:
+            raise ValueError('Pipeline has no model to predict with')
+        return (plain or models)[-1]
+
+    def predict(self, X):
+        last = self._predictor()
+        for i, stepRoles in enumerate(self.stepRoles[:last]):
+            if stepRoles & TRANSFORM:
+                X = self._apply(i, self.steps[i], 'transform', X)
+        return self._apply(last, self.steps[last], 'predict', X)
+
+    def _predictPath(self):
+        """
+        The steps predict runs, in order: the transforms before the predicting model, then the model.
+        """
+        last = self._predictor()
+        path = [(i, self.steps[i]) for i, stepRoles in enumerate(self.stepRoles[:last]) if stepRoles & TRANSFORM]
+        path.append((last, self.steps[last]))
+        return path
+
+    def _affinePath(self):
+        """
+        The predict path, when every step on it predicts with its affine form.
+        """
+        path = self._predictPath()
+        last, model = path[-1]
+        if self.stepRoles[last] & TRANSFORM:
+            # A model that is also a transform (PCA) predicts something other than its affine form
+            raise ValueError(f'Step {last} ({model.__class__.__name__}) is not affine as a predictor and cannot be compiled')
+        return path
+
+class CachedPipeline(CachedPipeline, Pipeline):
+    """
+    CachedPipeline on top of the roles Pipeline.
+    """
+    def fit(self, X, y):
+        inputKey = self.cache.fingerprint(X, y)
+        models = []
+        for i, stepRoles in enumerate(self.stepRoles):
+            obj = self.steps[i]
+            if stepRoles & TRANSFORM:
+                self._fitCached(models, X, y)
+                models = []
+                inputKey = self._fitCached([(i, obj, self.cache.key(obj, inputKey))], X, y)
+                X = self._apply(i, self.steps[i], 'transform', X)
+            elif stepRoles & FITTABLE:
+                models.append((i, obj, self.cache.key(obj, inputKey)))
+        self._fitCached(models, X, y)
+
+# %% codecell
+cached = CachedPipeline(FitCache(tempfile.mkdtemp()))
+cached.add(Normalize())
+cached.add(PCA(components=5))
+cached.add(LinearModel())
+for attempt in ('first', 'again'):
+    cached.fit(Xc, yc)
+    print(f'{attempt:<6} {cached.cache.report()}  roles {cached.stepRoles}')
+print(type(cached).__mro__.index(Pipeline) < type(cached).__mro__.index(IsinstancePipeline),
+      np.allclose(cached.compile().predict(Xc[:5]), cached.predict(Xc[:5])))
+
+# %% [md]
+# # Benchmark - Role Checks on 50 Step Pipelines
+# * Steps come from a 30 level deep multiple inheritance tree
+# * First the checks alone: 3 role questions per step, for 50 steps, 20k times
+# * Then single row transforms through 49 do-nothing steps, isinstance Pipeline vs roles Pipeline
+#   * Most of each step's time is the _apply and transform calls, which both Pipelines make
+#   * The flags only save the isinstance calls - about 1 us of ~20 us here, not the gap of the checks alone
+#   * Single runs vary by more than that, so the two Pipelines take turns and each keeps its best run
+
+# %% codecell
+class Mixin():
+    pass
+
+def deepClass(base, depth):
+    cls = base
+    for level in range(depth):
+        mixin = type(f'Mixin{level}', (Mixin,), {})
+        cls = type(f'{base.__name__}{level}', (mixin, cls), {})
+    return cls
+
+class PassThrough(BaseTransform):
+    def __init__(self):
+        pass
+
+    def fit(self, X, y):
+        pass
+
+    def transform(self, X):
+        return X
+
+DeepPass = deepClass(PassThrough, 30)
+DeepModel = deepClass(LinearModel, 30)
+steps = [DeepPass() for _ in range(49)] + [DeepModel()]
+print('MRO length', len(type(steps[0]).__mro__))
+
+def checkIsinstance(steps, repeat=20_000):
+    for _ in range(repeat):
+        for obj in steps:
+            isinstance(obj, Base), isinstance(obj, BaseTransform), isinstance(obj, BaseModel)
+
+def checkRoles(steps, repeat=20_000):
+    for _ in range(repeat):
+        for obj in steps:
+            r = roles(obj)
+            r & FITTABLE, r & TRANSFORM, r & MODEL
+
+for name, func in (('isinstance', checkIsinstance), ('roles', checkRoles)):
+    start = time.perf_counter()
+    func(steps)
+    print(f'{name:<11} {(time.perf_counter() - start) / (20_000 * 50 * 3) * 1e9:6.1f} ns per check')
+
+# %% codecell
+import timeit
+
+row = Xc[:1]
+pipes = {}
+for name, cls in (('isinstance Pipeline', IsinstancePipeline), ('roles Pipeline', Pipeline)):
+    pipes[name] = cls()
+    for step in steps[:-1]:
+        pipes[name].add(step)
+
+best = dict.fromkeys(pipes, float('inf'))
+for _ in range(15):
+    for name, deep in pipes.items():
+        best[name] = min(best[name], timeit.timeit(lambda: deep.transform(row), number=1_000) / 1_000)
+for name, seconds in best.items():
+    print(f'{name:<20} {seconds * 1e6:6.2f} us per transform')
+
+# %% [md]
+# # Grid Search
+# * Tuning means trying every combination of step parameters and scoring each with k-fold cross validation
+# * GridSearch takes a Pipeline of unfitted steps and a grid per step: {step index: {parameter: [values]}}
+# * Candidates sharing their upstream parameters share fitted prefixes
+#   * e.g. 3 PCA sizes x 4 model alphas: the Normalize + PCA prefix is fitted 3 times per fold, not 12
+#   * and Normalize, with no parameters at all, is fitted once per fold
+#   * A task scores every candidate on one fold, so every prefix it can share is fitted once
+#   * With more workers than folds, each fold is split by the first grid step's parameters to keep them busy -
+#     steps before that step are then fitted once per split
+#   * Each task takes its fold's rows out of X once
+# * Tasks run in a process pool (n_jobs)
+#   * X and y are copied once into shared memory; each task only sends its candidates and fold number
+# * Only the steps predict runs are fitted: the transforms before the predicting model (Pipeline._predictor), then the model
+# * A step is rebuilt from its class and parameters (stepParams - public attributes set in __init__), so
+#   a step's __init__ arguments must match its attribute names
+
+# %% codecell
+import copy
+import itertools
+from multiprocessing import shared_memory
+
+def r2(y, predicted):
+    return 1 - ((y - predicted) ** 2).mean() / y.var()
+
+def cloneStep(step, overrides):
+    return type(step)(**{**stepParams(step), **overrides})
+
+_shared = {}
+
+def attachShared(specs):
+    """
+    Process pool initializer: map the shared X and y into this worker.
+    """
+    for name, (shmName, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shmName)
+        _shared[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+def evaluateGroup(pipeline, candidates, foldIndex, folds, scoring, X=None, y=None):
+    """
+    Score candidates on one fold, reusing fitted prefixes that have the same parameters.
+    Only the steps predict runs are fitted. Returns (candidate number, score) pairs.
+    """
+    if X is None:
+        X, y = _shared['X'][1], _shared['y'][1]
+    test = folds[foldIndex]
+    train = np.concatenate([f for i, f in enumerate(folds) if i != foldIndex])
+    # Taken out of X once - every candidate starts from the same rows
+    foldTrain, foldTest, yTrain, yTest = X[train], X[test], y[train], y[test]
+    path = pipeline._predictPath()
+    last = path[-1][0]
+    prefixes = {}   # parameters of the path up to a transform -> its (train output, test output)
+    scores = []
+    for number, candidate in candidates:
+        Xtrain, Xtest = foldTrain, foldTest
+        key = ()
+        for i, step in path:
+            key += ((i, tuple(sorted(candidate.get(i, {}).items()))),)
+            if i != last and key in prefixes:
+                Xtrain, Xtest = prefixes[key]
+                continue
+            fitted = cloneStep(step, candidate.get(i, {}))
+            fitted.fit(Xtrain, yTrain)
+            if i == last:
+                scores.append((number, scoring(yTest, fitted.predict(Xtest))))
+            else:
+                Xtrain, Xtest = fitted.transform(Xtrain), fitted.transform(Xtest)
+                prefixes[key] = (Xtrain, Xtest)
+    return scores
+
+class GridSearch():
+    def __init__(self, pipeline, grid, folds=5, n_jobs=1, scoring=r2, seed=0):
+        self.pipeline = pipeline
+        self.grid = grid
+        self.folds = folds
+        self.n_jobs = n_jobs
+        self.scoring = scoring
+        self.seed = seed
+
+    def candidates(self):
+        """
+        Every combination of the grid, as {step index: {parameter: value}}.
+        """
+        axes = [(i, name, values) for i, params in sorted(self.grid.items()) for name, values in params.items()]
+        for values in itertools.product(*(values for _, _, values in axes)):
+            candidate = {}
+            for (i, name, _), value in zip(axes, values):
+                candidate.setdefault(i, {})[name] = value
+            yield candidate
+
+    def _tasks(self, candidates, n_jobs=1):
+        """
+        One task per fold scoring every candidate, or per fold and split when n_jobs needs more tasks.
+        A split keeps together the candidates that share the first grid step's parameters.
+        """
+        splits = -(-n_jobs // self.folds)
+        groups = {}
+        for number, candidate in enumerate(candidates):
+            first = tuple(sorted(candidate.get(min(self.grid), {}).items())) if self.grid else ()
+            groups.setdefault(first, []).append((number, candidate))
+        buckets = [[] for _ in range(min(splits, len(groups)) or 1)]
+        for k, group in enumerate(groups.values()):
+            buckets[k % len(buckets)].extend(group)
+        return [(bucket, fold) for bucket in buckets for fold in range(self.folds)]
+
+    def fit(self, X, y):
+        candidates = list(self.candidates())
+        order = np.random.default_rng(self.seed).permutation(len(X))
+        folds = np.array_split(order, self.folds)
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        tasks = self._tasks(candidates, n_jobs)
+        scores = [[] for _ in candidates]
+        if n_jobs == 1:
+            for group, fold in tasks:
+                for number, score in evaluateGroup(self.pipeline, group, fold, folds, self.scoring, X, y):
+                    scores[number].append(score)
+        else:
+            blocks = {name: shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+                      for name, a in (('X', X), ('y', y))}
+            try:
+                specs = {}
+                for name, a in (('X', X), ('y', y)):
+                    np.ndarray(a.shape, dtype=a.dtype, buffer=blocks[name].buf)[...] = a
+                    specs[name] = (blocks[name].name, a.shape, a.dtype)
+                with ProcessPoolExecutor(n_jobs, initializer=attachShared, initargs=(specs,)) as pool:
+                    futures = [pool.submit(evaluateGroup, self.pipeline, group, fold, folds, self.scoring)
+                               for group, fold in tasks]
+                    for future in futures:
+                        for number, score in future.result():
+                            scores[number].append(score)
+            finally:
+                for block in blocks.values():
+                    block.close()
+                    block.unlink()
+        self.results_ = sorted(((float(np.mean(s)), c) for s, c in zip(scores, candidates)),
+                               key=lambda r: -r[0])
+        self.bestScore_, self.best_ = self.results_[0]
+        # A copy of the unfitted template keeps its class and settings (n_jobs, cache, step roles)
+        self.bestPipeline_ = copy.deepcopy(self.pipeline)
+        self.bestPipeline_.steps = [cloneStep(step, self.best_.get(i, {})) for i, step in enumerate(self.pipeline.steps)]
+        self.bestPipeline_.fit(X, y)
+        return self
+
+# %% codecell
+template = Pipeline()
+template.add(Normalize())
+template.add(PCA(components=5))
+template.add(LinearModel())
+grid = {1: {'components': [5, 10, 20, 40]}, 2: {'alpha': [0.0, 1.0, 10.0, 100.0, 1000.0]}}
+
+search = GridSearch(template, grid, folds=5).fit(Xc[:20_000], yc[:20_000])
+for score, candidate in search.results_[:3]:
+    print(f'{score:.5f}', candidate)
+
+# A step after the predicting model doesn't change the score, so it isn't fitted during the search
+tail = Pipeline()
+tail.add(Normalize())
+tail.add(LinearModel())
+tail.add(Center())
+print(GridSearch(tail, {1: {'alpha': [0.0, 1000.0]}}, folds=3).fit(Xc[:5_000], yc[:5_000]).best_)
+
+# The best pipeline is built like the template - same class and n_jobs
+parallel = Pipeline(n_jobs=2)
+for step in template.steps:
+    parallel.add(step)
+best = GridSearch(parallel, grid, folds=3).fit(Xc[:5_000], yc[:5_000]).bestPipeline_
+print(type(best) is type(parallel), best.n_jobs, best.stepRoles, [stepParams(step) for step in best.steps])
+
+# Normalize has no parameters, so it is fitted once per fold; with 4 workers and 3 folds each fold is split in 2
+class CountingNormalize(Normalize):
+    fits = 0
+    def fit(self, X, y=None):
+        CountingNormalize.fits += 1
+        super().fit(X, y)
+
+counting = Pipeline()
+counting.add(CountingNormalize())
+counting.add(PCA(components=5))
+counting.add(LinearModel())
+searcher = GridSearch(counting, grid, folds=3)
+for n_jobs in (1, 4):
+    CountingNormalize.fits = 0
+    for group, fold in searcher._tasks(list(searcher.candidates()), n_jobs):
+        evaluateGroup(counting, group, fold, np.array_split(np.arange(3_000), 3), r2, Xc[:3_000], yc[:3_000])
+    print(f'n_jobs={n_jobs} Normalize fitted {CountingNormalize.fits} times for 3 folds')
+
+# %% [md]
+# # Benchmark - Grid Search vs a Naive Loop
+# * 20 candidates x 5 folds on 40k x 50 rows
+# * Naive: build and fit a whole pipeline for every candidate and fold, one after another
+# * GridSearch with n_jobs=1 shows the prefix reuse alone, larger n_jobs adds the process pool
+
+# %% codecell
+def naiveSearch(template, grid, X, y, folds=5):
+    order = np.random.default_rng(0).permutation(len(X))
+    parts = np.array_split(order, folds)
+    results = []
+    for candidate in GridSearch(template, grid).candidates():
+        scores = []
+        for f in range(folds):
+            train = np.concatenate([p for i, p in enumerate(parts) if i != f])
+            pipe = Pipeline()
+            for i, step in enumerate(template.steps):
+                pipe.add(cloneStep(step, candidate.get(i, {})))
+            pipe.fit(X[train], y[train])
+            scores.append(r2(y[parts[f]], pipe.predict(X[parts[f]])))
+        results.append((np.mean(scores), candidate))
+    return max(results, key=lambda r: r[0])
+
+start = time.perf_counter()
+naiveBest = naiveSearch(template, grid, Xc[:40_000], yc[:40_000])
+naive = time.perf_counter() - start
+print(f'naive loop          {naive:6.2f} s   best {naiveBest[1]}')
+for n_jobs in (1, 4):
+    start = time.perf_counter()
+    search = GridSearch(template, grid, folds=5, n_jobs=n_jobs).fit(Xc[:40_000], yc[:40_000])
+    elapsed = time.perf_counter() - start
+    print(f'GridSearch n_jobs={n_jobs} {elapsed:6.2f} s   best {search.best_}   '
+          f'speedup {naive / elapsed:4.1f}x  (cores={os.cpu_count()})')